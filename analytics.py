@@ -0,0 +1,128 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import statistics
+from array import array
+from collections import defaultdict
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import LRUCache
+import crud_async
+import events
+from tenants import current_tenant
+
+try:
+    import numpy
+except ImportError:
+    # Statistics fall back to the array and statistics modules
+    numpy = None
+
+AT_RISK_THRESHOLD = 3.0
+GRADE_SCALE = (1, 2, 3, 4, 5)
+
+
+class SubjectStatistics:
+    """Distribution of one subject's grades plus each student's mean"""
+
+    __slots__ = ("subject_id", "count", "mean", "median", "std", "histogram", "student_ids", "student_means")
+
+    def __init__(self, subject_id, count, mean, median, std, histogram, student_ids, student_means):
+        self.subject_id = subject_id
+        self.count = count
+        self.mean = mean
+        self.median = median
+        self.std = std
+        self.histogram = histogram
+        self.student_ids = student_ids
+        self.student_means = student_means
+
+    def at_risk(self, threshold: float = AT_RISK_THRESHOLD) -> list:
+        """(student_id, mean) of every student whose mean is below threshold, lowest first"""
+        return sorted(
+            ((student_id, mean) for student_id, mean in zip(self.student_ids, self.student_means) if mean < threshold),
+            key=lambda item: item[1],
+        )
+
+
+def _compute_numpy(subject_id: int, student_ids, values) -> SubjectStatistics:
+    values = numpy.asarray(values, dtype=numpy.float64)
+    students, index = numpy.unique(numpy.asarray(student_ids, dtype=numpy.int64), return_inverse=True)
+    means = numpy.bincount(index, weights=values) / numpy.bincount(index)
+    counts = numpy.bincount(numpy.rint(values).astype(numpy.int64), minlength=GRADE_SCALE[-1] + 1)
+    return SubjectStatistics(
+        subject_id, int(values.size), float(values.mean()), float(numpy.median(values)), float(values.std()),
+        {grade: int(counts[grade]) for grade in GRADE_SCALE}, students.tolist(), means.tolist(),
+    )
+
+
+def _compute_array(subject_id: int, student_ids, values) -> SubjectStatistics:
+    totals = defaultdict(lambda: [0.0, 0])
+    histogram = dict.fromkeys(GRADE_SCALE, 0)
+    for student_id, value in zip(student_ids, values):
+        totals[student_id][0] += value
+        totals[student_id][1] += 1
+        grade = round(value)
+        if grade in histogram:
+            histogram[grade] += 1
+    students = sorted(totals)
+    return SubjectStatistics(
+        subject_id, len(values), statistics.fmean(values), statistics.median(values), statistics.pstdev(values),
+        histogram, students, [totals[student_id][0] / totals[student_id][1] for student_id in students],
+    )
+
+
+def compute_subject_statistics(subject_id: int, rows) -> SubjectStatistics:
+    """Statistics from (student_id, value) rows, vectorized when NumPy is installed"""
+    if not rows:
+        return SubjectStatistics(subject_id, 0, 0.0, 0.0, 0.0, dict.fromkeys(GRADE_SCALE, 0), [], [])
+    # Compact column arrays instead of per-row objects
+    student_ids = array("q", (row[0] for row in rows))
+    values = array("d", (row[1] for row in rows))
+    if numpy is not None:
+        return _compute_numpy(subject_id, student_ids, values)
+    return _compute_array(subject_id, student_ids, values)
+
+
+# Writes made by another worker process are not seen by _invalidate; the TTL
+# bounds how long their statistics can lag
+STATISTICS_CACHE_TTL = 60
+_statistics_cache = LRUCache(maxsize=256, ttl=STATISTICS_CACHE_TTL)
+# Bumped on every write to a subject, so a result computed while grades were
+# being added is not cached
+_generations = defaultdict(int)
+
+
+async def get_subject_statistics(db: AsyncSession, subject_id: int) -> SubjectStatistics:
+    key = (current_tenant(), subject_id)
+    cached = _statistics_cache.get(key)
+    if cached is None:
+        generation = _generations[key]
+        rows = await crud_async.get_subject_grade_columns(db, subject_id)
+        cached = await asyncio.to_thread(compute_subject_statistics, subject_id, rows)
+        if _generations[key] == generation:
+            _statistics_cache.set(key, cached)
+    return cached
+
+
+def _invalidate(student_ids, subject_ids):
+    tenant = current_tenant()
+    for subject_id in subject_ids:
+        _generations[(tenant, subject_id)] += 1
+        _statistics_cache.pop((tenant, subject_id))
+
+
+events.subscribe(events.GRADES_CHANGED, _invalidate)
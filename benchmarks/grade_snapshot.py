@@ -0,0 +1,104 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Memory and render time of dashboard grade rows: eager-loaded ORM objects
+versus the Core rows returned by crud_ops.grade_rows_statement.
+
+    python benchmarks/grade_snapshot.py --rows 10000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Template
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, Subject, Grade
+import crud_ops
+
+# The grade rows of dashboard.html, before and after the switch to Core rows
+ORM_TEMPLATE = Template("""{% for grade in grades %}<tr><td>{{ grade.student.username }}</td><td>{{ grade.subject.name }}</td>
+<td>{{ grade.value }}</td><td>{{ grade.date.strftime('%d.%m.%Y') if grade.date else '' }}</td></tr>{% endfor %}""")
+ROW_TEMPLATE = Template("""{% for grade in grades %}<tr><td>{{ grade.student }}</td><td>{{ grade.subject }}</td>
+<td>{{ grade.value }}</td><td>{{ grade.date.strftime('%d.%m.%Y') if grade.date else '' }}</td></tr>{% endfor %}""")
+
+
+def seed(engine, rows: int):
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"username": f"student{i}", "hashed_password": "-", "role": "student"} for i in range(1, 301)
+        ])
+        connection.execute(insert(Subject), [{"name": f"subject{i}"} for i in range(1, 9)])
+        connection.execute(insert(Grade), [
+            {"value": 1 + n % 5, "student_id": 1 + n % 300, "subject_id": 1 + n % 8} for n in range(rows)
+        ])
+
+
+def load_orm(db, rows: int):
+    return crud_ops._grades_query(db).order_by(Grade.date.desc(), Grade.id.desc()).limit(rows).all()
+
+
+def load_rows(db, rows: int):
+    statement = crud_ops.grade_rows_statement().order_by(Grade.date.desc(), Grade.id.desc()).limit(rows)
+    return db.execute(statement).all()
+
+
+def measure(session_factory, loader, template, rows: int) -> dict:
+    # A fresh session per run so the identity map starts empty
+    db = session_factory()
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        grades = loader(db, rows)
+        load_time = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        template.render(grades=grades)
+        render_time = time.perf_counter() - started
+    finally:
+        db.close()
+    return {"peak_mb": peak / 2 ** 20, "load_ms": load_time * 1000, "render_ms": render_time * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        seed(engine, args.rows)
+        session_factory = sessionmaker(bind=engine)
+        print(f"{args.rows} rows")
+        print(f"{'path':<8}{'peak MB':>10}{'load ms':>10}{'render ms':>11}")
+        for name, loader, template in (("orm", load_orm, ORM_TEMPLATE), ("core", load_rows, ROW_TEMPLATE)):
+            result = measure(session_factory, loader, template, args.rows)
+            print(f"{name:<8}{result['peak_mb']:>10.1f}{result['load_ms']:>10.1f}{result['render_ms']:>11.1f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
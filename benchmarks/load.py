@@ -0,0 +1,296 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Load test of the real request paths against a synthetic school.
+
+Seeds a school (users, subjects, grades) in a scratch directory and drives the
+FastAPI app in-process, or a running server with --url, through /login, / as a
+teacher and as a student, POST /grade and GET /users. Reports throughput,
+p50/p95/p99 latency and errors per scenario, and the peak RSS. A response is
+an error unless it has the scenario's expected status (and, for pages, no
+error modal). --save-baseline stores the results as JSON; --baseline compares
+against a stored run and exits 1 when a scenario's throughput, p95 or the
+peak RSS regresses by more than --threshold percent, or errors increase.
+
+    python benchmarks/load.py --students 500 --grades 20000 --save-baseline benchmarks/baseline.json
+    python benchmarks/load.py --students 500 --grades 20000 --baseline benchmarks/baseline.json
+
+For --url, start the server from the printed scratch directory after seeding
+with --seed-only, e.g. (cd DIR && uvicorn main:app --port 8002).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import httpx
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "bench-admin"
+STUDENT_PASSWORD = "bench-student"
+SCENARIOS = ("login", "teacher_home", "student_home", "post_grade", "users")
+# Form posts redirect on success; pages are 200. The app reports failures as a
+# 200 page with an error modal (alert.html, error.html), so pages are checked
+# for those as well.
+EXPECTED_STATUS = {"login": 302, "teacher_home": 200, "student_home": 200, "post_grade": 302, "users": 200}
+ERROR_PAGE_MARKERS = ("alert-modal", "modal-header bg-danger")
+
+
+def prepare_workdir(workdir: str):
+    """Lay out config.json, templates/ and static/ the way the app expects them"""
+    os.makedirs(os.path.join(workdir, "templates"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    for name in os.listdir(REPO):
+        if name.endswith(".html"):
+            shutil.copy(os.path.join(REPO, name), os.path.join(workdir, "templates", name))
+    shutil.copy(os.path.join(REPO, "style.css"), os.path.join(workdir, "static", "style.css"))
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "language": "ru",
+            "grading_system": "5-point",
+            "admin_username": ADMIN_USERNAME,
+            "admin_password": ADMIN_PASSWORD,
+        }, f)
+
+
+def seed(args):
+    """Create users.db in the current directory with the synthetic school"""
+    from models import User, Subject, Grade
+    from migrations import upgrade
+    from database import configure_sqlite
+    from passwords import get_password_hash
+    import crud_ops
+
+    engine = configure_sqlite(create_engine("sqlite:///users.db"))
+    upgrade(engine)
+    rng = random.Random(args.seed)
+    # One hash shared by every seeded account, so seeding doesn't take minutes
+    student_hash = get_password_hash(STUDENT_PASSWORD)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"username": ADMIN_USERNAME, "hashed_password": get_password_hash(ADMIN_PASSWORD), "role": "teacher"}
+        ] + [
+            {"username": f"teacher{i}", "hashed_password": student_hash, "role": "teacher"}
+            for i in range(1, args.teachers)
+        ] + [
+            {"username": f"student{i}", "hashed_password": student_hash, "role": "student"}
+            for i in range(1, args.students + 1)
+        ])
+        connection.execute(insert(Subject), [{"name": f"subject{i}"} for i in range(1, args.subjects + 1)])
+        student_ids = list(connection.scalars(select(User.id).where(User.role == "student")))
+        subject_ids = list(connection.scalars(select(Subject.id)))
+        connection.execute(insert(Grade), [
+            {"value": rng.randint(1, 5), "student_id": rng.choice(student_ids), "subject_id": rng.choice(subject_ids)}
+            for _ in range(args.grades)
+        ])
+    with Session(engine) as db:
+        crud_ops.rebuild_grade_stats(db)
+        db.commit()
+    engine.dispose()
+    return student_ids, subject_ids
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/login", data={"username": username, "password": password})
+    token = response.cookies.get("session")
+    if response.status_code != 302 or not token:
+        raise RuntimeError(f"login as {username} failed with {response.status_code}")
+    return token
+
+
+def succeeded(response: httpx.Response, expected_status: int) -> bool:
+    if response.status_code != expected_status:
+        return False
+    return expected_status != 200 or not any(marker in response.text for marker in ERROR_PAGE_MARKERS)
+
+
+async def run_scenario(client, make_request, expected_status: int, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            started = time.perf_counter()
+            response = await make_request(n)
+            latencies.append(time.perf_counter() - started)
+            if not succeeded(response, expected_status):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def server_peak_rss_kb(pid: int):
+    # VmHWM is the peak resident set size of the server process
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def drive(args, student_ids: list, subject_ids: list) -> dict:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        import main
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+
+    rng = random.Random(args.seed)
+    results = {}
+    async with client:
+        teacher = {"Cookie": f"session={await login(client, ADMIN_USERNAME, ADMIN_PASSWORD)}"}
+        # Student pages are cached per student, so spread requests over many of them
+        students = [
+            {"Cookie": f"session={await login(client, f'student{i}', STUDENT_PASSWORD)}"}
+            for i in range(1, min(args.students, args.student_sessions) + 1)
+        ]
+
+        requests = {
+            "login": lambda n: client.post("/login", data={
+                "username": f"student{n % args.students + 1}", "password": STUDENT_PASSWORD,
+            }),
+            "teacher_home": lambda n: client.get("/", headers=teacher),
+            "student_home": lambda n: client.get("/", headers=students[n % len(students)]),
+            "post_grade": lambda n: client.post("/grade", headers=teacher, data={
+                "student_id": rng.choice(student_ids), "subject_id": rng.choice(subject_ids), "value": rng.randint(1, 5),
+            }),
+            "users": lambda n: client.get("/users", headers=teacher),
+        }
+        for name in args.scenarios:
+            result = await run_scenario(client, requests[name], EXPECTED_STATUS[name], args.requests, args.concurrency)
+            results[name] = result
+            print(
+                f"{name:<14}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}"
+                f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+            )
+    return results
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    before_rss, rss = baseline.get("peak_rss_kb"), report["peak_rss_kb"]
+    if before_rss and rss and rss > before_rss * (1 + threshold / 100):
+        regressions.append(f"peak RSS {before_rss} -> {rss} KiB")
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        if result["throughput"] < before["throughput"] * (1 - threshold / 100):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if result["p95_ms"] > before["p95_ms"] * (1 + threshold / 100):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["errors"] > before.get("errors", 0):
+            regressions.append(f"{name}: errors {before.get('errors', 0)} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--subjects", type=int, default=8)
+    parser.add_argument("--grades", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--student-sessions", type=int, default=50, help="students logged in for student_home")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--seed-only", action="store_true", help="seed the workdir and exit")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="server process to read peak RSS from with --url")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed regression in percent")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="openschool-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    prepare_workdir(workdir)
+    # The app opens config.json, users.db and templates/ relative to the cwd
+    os.chdir(workdir)
+    student_ids, subject_ids = seed(args)
+    print(f"Seeded {args.students} students, {args.teachers} teachers, {args.subjects} subjects, "
+          f"{args.grades} grades in {workdir}")
+    if args.seed_only:
+        return 0
+
+    print(f"{'scenario':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = asyncio.run(drive(args, student_ids, subject_ids))
+    if args.url:
+        peak_rss_kb = server_peak_rss_kb(args.server_pid) if args.server_pid else None
+    else:
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Peak RSS: {peak_rss_kb} KiB" if peak_rss_kb else "Peak RSS: unknown (pass --server-pid)")
+
+    report = {
+        "settings": {key: getattr(args, key) for key in ("students", "teachers", "subjects", "grades", "requests", "concurrency")},
+        "peak_rss_kb": peak_rss_kb,
+        "scenarios": results,
+    }
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline written to {save_path}")
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No scenario regressed by more than {args.threshold:.0f}%.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
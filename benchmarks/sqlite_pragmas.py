@@ -0,0 +1,123 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Dashboard read throughput while grades are being written, with SQLite
+defaults versus the pragma profile from database.SQLITE_PRAGMAS.
+
+    python benchmarks/sqlite_pragmas.py --seconds 5 --readers 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, create_engine, event, insert, select
+from sqlalchemy.exc import OperationalError
+from models import Base, User, Subject, Grade
+import database
+
+
+def make_engine(path: str, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        event.listen(engine, "connect", database.apply_sqlite_pragmas)
+    return engine
+
+
+def seed(engine, students: int, grades_per_student: int):
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"username": f"student{i}", "hashed_password": "-", "role": "student"}
+            for i in range(1, students + 1)
+        ])
+        connection.execute(insert(Subject), [{"name": f"subject{i}"} for i in range(1, 5)])
+        connection.execute(insert(Grade), [
+            {"value": 1 + n % 5, "student_id": i, "subject_id": 1 + n % 4}
+            for i in range(1, students + 1) for n in range(grades_per_student)
+        ])
+
+
+def run(engine, seconds: float, readers: int, students: int) -> dict:
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    student_grades = select(Grade.value, Grade.date, Subject.name).join(Subject).where(Grade.student_id == bindparam("sid"))
+
+    def reader(offset: int):
+        sid = offset
+        while not stop.is_set():
+            sid = sid % students + 1
+            try:
+                with engine.connect() as connection:
+                    connection.execute(student_grades, {"sid": sid}).all()
+                key = "reads"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    def writer():
+        sid = 0
+        while not stop.is_set():
+            sid = sid % students + 1
+            try:
+                # One transaction per grade, like crud_ops.create_grade
+                with engine.begin() as connection:
+                    connection.execute(insert(Grade), {"value": 5, "student_id": sid, "subject_id": 1})
+                key = "writes"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--grades-per-student", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'errors/s':>12}")
+    for name, tuned in (("default", False), ("tuned", True)):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = make_engine(os.path.join(directory, "bench.db"), tuned)
+            seed(engine, args.students, args.grades_per_student)
+            result = run(engine, args.seconds, args.readers, args.students)
+            engine.dispose()
+        print(f"{name:<10}{result['reads']:>12.1f}{result['writes']:>12.1f}{result['errors']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
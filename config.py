@@ -0,0 +1,111 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+CONFIG_PATH = "config.json"
+DATABASE_PATH = "users.db"
+
+# How often get_config() may stat config.json to notice edits on disk
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    language: str = "ru"
+    grading_system: str = "5-point"
+    admin_username: str = "admin"
+    admin_password: Optional[str] = None
+    raw: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AppConfig":
+        return cls(
+            language=data.get("language", "ru"),
+            grading_system=data.get("grading_system", "5-point"),
+            admin_username=data.get("admin_username", "admin"),
+            admin_password=data.get("admin_password"),
+            raw=dict(data),
+        )
+
+    def get(self, key: str, default=None):
+        # Optional settings without a dedicated field
+        return self.raw.get(key, default)
+
+
+_lock = threading.Lock()
+_snapshot: Optional[AppConfig] = None
+_mtime: Optional[float] = None
+_checked_at = 0.0
+_setup_done = set()
+
+
+def _file_mtime() -> Optional[float]:
+    try:
+        return os.stat(CONFIG_PATH).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def reload_config() -> Optional[AppConfig]:
+    """Re-read config.json from disk; None when the file does not exist"""
+    global _snapshot, _mtime, _checked_at
+    with _lock:
+        mtime = _file_mtime()
+        snapshot = None
+        if mtime is not None:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                snapshot = AppConfig.from_dict(json.load(f))
+        _snapshot, _mtime, _checked_at = snapshot, mtime, time.monotonic()
+        return snapshot
+
+
+def get_config() -> Optional[AppConfig]:
+    """Return the in-memory config snapshot, reloading it if config.json changed"""
+    global _checked_at
+    now = time.monotonic()
+    if _checked_at == 0.0 or now - _checked_at >= RELOAD_CHECK_INTERVAL:
+        if _checked_at == 0.0 or _file_mtime() != _mtime:
+            return reload_config()
+        _checked_at = now
+    return _snapshot
+
+
+def save_config(data: dict) -> AppConfig:
+    """Write config.json and make it the current snapshot"""
+    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return reload_config()
+
+
+def is_setup_done(database_path: str = DATABASE_PATH) -> bool:
+    """True once both config.json and the database exist; remembered after that"""
+    if database_path not in _setup_done:
+        if not (os.path.exists(CONFIG_PATH) and os.path.exists(database_path)):
+            return False
+        _setup_done.add(database_path)
+    return True
+
+
+def get_admin_username() -> Optional[str]:
+    config = get_config()
+    return config.admin_username if config else None
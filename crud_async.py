@@ -0,0 +1,79 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Async versions of crud_ops for request handlers. Each one runs the sync
+# crud_ops function through AsyncSession.run_sync, so queries are written once
+# and the database I/O goes through aiosqlite without blocking the event loop.
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from hashing import hash_password_async
+import crud_ops
+import group_commit
+
+
+def _run_sync(fn):
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        if not fn.read_only and db.info.get("read_only"):
+            raise RuntimeError(f"{fn.__name__} writes and needs a session from get_write_db")
+        return await db.run_sync(fn, *args, **kwargs)
+
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+get_user_by_username = _run_sync(crud_ops.get_user_by_username)
+get_user = _run_sync(crud_ops.get_user)
+get_students = _run_sync(crud_ops.get_students)
+get_users_except = _run_sync(crud_ops.get_users_except)
+get_subject_by_name = _run_sync(crud_ops.get_subject_by_name)
+create_subject = _run_sync(crud_ops.create_subject)
+get_subject = _run_sync(crud_ops.get_subject)
+get_subjects = _run_sync(crud_ops.get_subjects)
+create_grades_bulk = _run_sync(crud_ops.create_grades_bulk)
+insert_grades = _run_sync(crud_ops.insert_grades)
+insert_users = _run_sync(crud_ops.insert_users)
+get_existing_usernames = _run_sync(crud_ops.get_existing_usernames)
+get_student_ids_by_username = _run_sync(crud_ops.get_student_ids_by_username)
+get_grades_for_student = _run_sync(crud_ops.get_grades_for_student)
+get_grades_for_subject = _run_sync(crud_ops.get_grades_for_subject)
+get_grades_for_student_and_subject = _run_sync(crud_ops.get_grades_for_student_and_subject)
+get_all_grades = _run_sync(crud_ops.get_all_grades)
+get_grades_page = _run_sync(crud_ops.get_grades_page)
+get_average_grade_for_student = _run_sync(crud_ops.get_average_grade_for_student)
+get_average_grade_for_student_by_subject = _run_sync(crud_ops.get_average_grade_for_student_by_subject)
+get_subject_summary_for_student = _run_sync(crud_ops.get_subject_summary_for_student)
+get_subject_grade_columns = _run_sync(crud_ops.get_subject_grade_columns)
+get_usernames = _run_sync(crud_ops.get_usernames)
+
+
+# Single-row writes go through the group commit writer instead of a request
+# session; they return once the row is committed
+
+
+async def create_grade(value: float, student_id: int, subject_id: int):
+    return await group_commit.submit(crud_ops.add_grade, value, student_id, subject_id)
+
+
+async def create_user(username: str, password: str, role: str):
+    # Hash in the hashing pool first; the writer must never wait on a hash
+    hashed_password = await hash_password_async(password)
+    return await group_commit.submit(crud_ops.add_user, username, role, hashed_password)
+
+
+async def update_user_password(user_id: int, hashed_password: str):
+    return await group_commit.submit(crud_ops.set_user_password, user_id, hashed_password)
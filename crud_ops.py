@@ -14,101 +14,476 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import User, Subject, Grade
-from passlib.context import CryptContext
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, and_, or_, select, insert, delete, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import User, Subject, Grade, StudentSubjectStats, StudentStats
+from collections import defaultdict
+from passwords import get_password_hash
+from datetime import datetime
+import base64
 import hashlib
+import events
 
-# Configure argon2 for password hashing
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", argon2__rounds=10, argon2__memory_cost=1024, argon2__parallelism=2)
+# Page size limits for the teacher grades feed
+GRADES_PAGE_SIZE = 50
+MAX_GRADES_PAGE_SIZE = 200
 
+# Subjects every new school database starts with
+DEFAULT_SUBJECTS = ["Math", "Science", "English", "History"]
 
-def get_password_hash(password):
-    # Truncate password to 72 bytes if needed to be compatible with bcrypt
-    if len(password.encode('utf-8')) > 72:
-        # Truncate to 72 bytes and decode back to string
-        password = password.encode('utf-8')[:72].decode('utf-8', errors='ignore')
-    return pwd_context.hash(password)
 
+# Every function taking a session is marked with one of these. crud_async
+# refuses to run a read_write function on a read-only session, so a handler
+# that writes has to ask for the writer with get_write_db.
+def read_only(fn):
+    fn.read_only = True
+    return fn
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
+def read_write(fn):
+    fn.read_only = False
+    return fn
 
+
+def publish_on_commit(db: Session, topic: str, **payload):
+    """Publish an event once the session's transaction commits; dropped on rollback.
+    Several writes committed together (see group_commit.py) publish together."""
+    db.info.setdefault("pending_events", []).append((topic, payload))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    for topic, payload in session.info.pop("pending_events", []):
+        events.publish(topic, **payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_events(session):
+    session.info.pop("pending_events", None)
+
+@read_only
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
 
+@read_only
 def get_user(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
 
 
-def create_user(db: Session, username: str, password: str, role: str):
-    hashed_password = get_password_hash(password)
+@read_only
+def get_students(db: Session):
+    # (id, username) rows are all the dashboard selects need
+    return db.execute(
+        select(User.id, User.username).where(User.role == "student").order_by(User.username)
+    ).all()
+
+
+@read_only
+def get_users_except(db: Session, user_id: int):
+    return db.query(User).filter(User.id != user_id).all()
+
+
+@read_write
+def add_user(db: Session, username: str, role: str, hashed_password: str):
+    """Stage a new user in the caller's transaction"""
     db_user = User(username=username, hashed_password=hashed_password, role=role)
     db.add(db_user)
+    db.flush()
+    publish_on_commit(db, events.USER_CHANGED, user_id=db_user.id)
+    return db_user
+
+
+@read_write
+def create_user(db: Session, username: str, password: str, role: str, hashed_password: str = None):
+    # Async callers hash in the hashing pool beforehand and pass the result in
+    if hashed_password is None:
+        hashed_password = get_password_hash(password)
+    db_user = add_user(db, username, role, hashed_password)
     db.commit()
     db.refresh(db_user)
     return db_user
 
 
+@read_write
+def set_user_password(db: Session, user_id: int, hashed_password: str):
+    """Stage a password hash change in the caller's transaction"""
+    user = db.get(User, user_id)
+    user.hashed_password = hashed_password
+    publish_on_commit(db, events.USER_CHANGED, user_id=user_id)
+    return user
+
+
+@read_only
 def get_subject_by_name(db: Session, name: str):
     return db.query(Subject).filter(Subject.name == name).first()
 
 
+@read_write
 def create_subject(db: Session, name: str):
     db_subject = Subject(name=name)
     db.add(db_subject)
+    db.flush()
+    publish_on_commit(db, events.SUBJECTS_CHANGED, subject_id=db_subject.id)
     db.commit()
     db.refresh(db_subject)
     return db_subject
 
 
+@read_write
+def create_default_subjects(db: Session):
+    for subject_name in DEFAULT_SUBJECTS:
+        if not get_subject_by_name(db, subject_name):
+            create_subject(db, subject_name)
+
+
+@read_only
 def get_subject(db: Session, subject_id: int):
     return db.query(Subject).filter(Subject.id == subject_id).first()
 
 
+@read_only
 def get_subjects(db: Session):
-    return db.query(Subject).all()
+    return db.execute(select(Subject.id, Subject.name)).all()
 
 
-def create_grade(db: Session, value: float, student_id: int, subject_id: int):
+@read_write
+def add_grade(db: Session, value: float, student_id: int, subject_id: int):
+    """Stage a grade and its summary rows in the caller's transaction"""
     # Validate that the grade is between 1 and 5 for the Russian 5-point system
     if value < 1 or value > 5:
         raise ValueError("Оценка должна быть от 1 до 5")
     
     db_grade = Grade(value=value, student_id=student_id, subject_id=subject_id)
     db.add(db_grade)
+    add_to_grade_stats(db, [{"value": value, "student_id": student_id, "subject_id": subject_id}])
+    db.flush()
+    publish_on_commit(db, events.GRADES_CHANGED, student_ids={student_id}, subject_ids={subject_id})
+    return db_grade
+
+
+@read_write
+def create_grade(db: Session, value: float, student_id: int, subject_id: int):
+    db_grade = add_grade(db, value, student_id, subject_id)
     db.commit()
     db.refresh(db_grade)
     return db_grade
 
 
+@read_write
+def add_to_grade_stats(db: Session, rows: list):
+    """Fold new grades into the summary tables; runs in the caller's transaction"""
+    if not rows:
+        return
+    by_subject = defaultdict(lambda: [0.0, 0])
+    by_student = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        for totals in (by_subject[row["student_id"], row["subject_id"]], by_student[row["student_id"]]):
+            totals[0] += row["value"]
+            totals[1] += 1
+
+    statement = sqlite_insert(StudentSubjectStats)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[StudentSubjectStats.student_id, StudentSubjectStats.subject_id],
+        set_={
+            "grade_sum": StudentSubjectStats.grade_sum + statement.excluded.grade_sum,
+            "grade_count": StudentSubjectStats.grade_count + statement.excluded.grade_count,
+        },
+    ), [
+        {"student_id": student_id, "subject_id": subject_id, "grade_sum": total, "grade_count": count}
+        for (student_id, subject_id), (total, count) in by_subject.items()
+    ])
+    statement = sqlite_insert(StudentStats)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[StudentStats.student_id],
+        set_={
+            "grade_sum": StudentStats.grade_sum + statement.excluded.grade_sum,
+            "grade_count": StudentStats.grade_count + statement.excluded.grade_count,
+        },
+    ), [
+        {"student_id": student_id, "grade_sum": total, "grade_count": count}
+        for student_id, (total, count) in by_student.items()
+    ])
+
+
+def _grade_stats_from_grades():
+    # Summary rows recomputed from the raw grades table
+    by_subject = select(
+        Grade.student_id, Grade.subject_id,
+        func.sum(Grade.value).label("grade_sum"), func.count().label("grade_count"),
+    ).group_by(Grade.student_id, Grade.subject_id)
+    by_student = select(
+        Grade.student_id, func.sum(Grade.value).label("grade_sum"), func.count().label("grade_count"),
+    ).group_by(Grade.student_id)
+    return by_subject, by_student
+
+
+@read_write
+def rebuild_grade_stats(db):
+    """Recompute both summary tables from the grades table; the caller commits"""
+    by_subject, by_student = _grade_stats_from_grades()
+    db.execute(delete(StudentSubjectStats))
+    db.execute(insert(StudentSubjectStats).from_select(
+        ["student_id", "subject_id", "grade_sum", "grade_count"], by_subject
+    ))
+    db.execute(delete(StudentStats))
+    db.execute(insert(StudentStats).from_select(["student_id", "grade_sum", "grade_count"], by_student))
+
+
+@read_only
+def verify_grade_stats(db) -> list:
+    """Return a description of every summary row that disagrees with the raw grades"""
+    by_subject, by_student = _grade_stats_from_grades()
+    mismatches = []
+    checks = (
+        (by_subject, select(StudentSubjectStats.student_id, StudentSubjectStats.subject_id,
+                            StudentSubjectStats.grade_sum, StudentSubjectStats.grade_count), 2),
+        (by_student, select(StudentStats.student_id, StudentStats.grade_sum, StudentStats.grade_count), 1),
+    )
+    for expected_query, stored_query, key_size in checks:
+        expected = {tuple(row[:key_size]): tuple(row[key_size:]) for row in db.execute(expected_query)}
+        stored = {
+            tuple(row[:key_size]): tuple(row[key_size:]) for row in db.execute(stored_query)
+            if row[-1] != 0
+        }
+        for key in expected.keys() | stored.keys():
+            want, have = expected.get(key, (0.0, 0)), stored.get(key, (0.0, 0))
+            if want[1] != have[1] or abs(want[0] - have[0]) > 1e-6:
+                mismatches.append(f"{key}: expected sum={want[0]} count={want[1]}, stored sum={have[0]} count={have[1]}")
+    return mismatches
+
+
+@read_only
+def validate_grade_rows(db: Session, rows: list) -> list:
+    """Return a list of error messages for bulk grade rows; empty if all are valid"""
+    errors = []
+    student_ids = {row["student_id"] for row in rows}
+    subject_ids = {row["subject_id"] for row in rows}
+    known_students = set(db.scalars(
+        select(User.id).where(User.id.in_(student_ids), User.role == "student")
+    )) if student_ids else set()
+    known_subjects = set(db.scalars(
+        select(Subject.id).where(Subject.id.in_(subject_ids))
+    )) if subject_ids else set()
+
+    for number, row in enumerate(rows, start=1):
+        if row["value"] < 1 or row["value"] > 5:
+            errors.append(f"Строка {number}: оценка должна быть от 1 до 5")
+        if row["student_id"] not in known_students:
+            errors.append(f"Строка {number}: ученик {row['student_id']} не найден")
+        if row["subject_id"] not in known_subjects:
+            errors.append(f"Строка {number}: предмет {row['subject_id']} не найден")
+    return errors
+
+
+@read_write
+def create_grades_bulk(db: Session, rows: list) -> int:
+    """Validate all rows up front, then insert them with one executemany in one transaction"""
+    errors = validate_grade_rows(db, rows)
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    return insert_grades(db, rows)
+
+
+@read_write
+def insert_grades(db: Session, rows: list) -> int:
+    # Rows must already be validated; one executemany and one commit
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    db.execute(insert(Grade), [
+        {
+            "value": row["value"],
+            "student_id": row["student_id"],
+            "subject_id": row["subject_id"],
+            "date": row.get("date") or now,
+        }
+        for row in rows
+    ])
+    add_to_grade_stats(db, rows)
+    publish_on_commit(
+        db,
+        events.GRADES_CHANGED,
+        student_ids={row["student_id"] for row in rows},
+        subject_ids={row["subject_id"] for row in rows},
+    )
+    db.commit()
+    return len(rows)
+
+
+@read_write
+def insert_users(db: Session, rows: list) -> int:
+    # Rows carry username, hashed_password and role; one executemany and one commit
+    db.execute(insert(User), rows)
+    publish_on_commit(db, events.USERS_ADDED, count=len(rows))
+    db.commit()
+    return len(rows)
+
+
+@read_only
+def get_existing_usernames(db: Session, usernames) -> set:
+    if not usernames:
+        return set()
+    return set(db.scalars(select(User.username).where(User.username.in_(usernames))))
+
+
+@read_only
+def get_student_ids_by_username(db: Session, usernames) -> dict:
+    if not usernames:
+        return {}
+    rows = db.execute(
+        select(User.username, User.id).where(User.username.in_(usernames), User.role == "student")
+    )
+    return dict(rows.all())
+
+
+def _grades_query(db: Session):
+    # Templates read grade.student and grade.subject for every row, so load both
+    # in the same SELECT instead of one lazy load per row
+    return db.query(Grade).options(joinedload(Grade.student), joinedload(Grade.subject))
+
+
+@read_only
 def get_grades_for_student(db: Session, student_id: int):
-    return db.query(Grade).filter(Grade.student_id == student_id).all()
+    # Read-only rows for the student page, newest first
+    statement = grade_rows_statement(student_id=student_id).order_by(Grade.date.desc(), Grade.id.desc())
+    return db.execute(statement).all()
 
 
+@read_only
 def get_grades_for_subject(db: Session, subject_id: int):
-    return db.query(Grade).filter(Grade.subject_id == subject_id).all()
+    return _grades_query(db).filter(Grade.subject_id == subject_id).all()
 
 
+@read_only
 def get_grades_for_student_and_subject(db: Session, student_id: int, subject_id: int):
-    return db.query(Grade).filter(Grade.student_id == student_id, Grade.subject_id == subject_id).all()
+    return _grades_query(db).filter(Grade.student_id == student_id, Grade.subject_id == subject_id).all()
 
 
+@read_only
 def get_all_grades(db: Session):
-    return db.query(Grade).order_by(Grade.date.desc()).all()
-
-
+    return _grades_query(db).order_by(Grade.date.desc()).all()
+
+
+def encode_grade_cursor(grade: Grade) -> str:
+    # Cursor points at the last row of a page: "<iso date>|<id>" in urlsafe base64
+    raw = f"{grade.date.isoformat()}|{grade.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_grade_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        date_part, id_part = raw.split("|", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeError):
+        raise ValueError("Некорректный курсор страницы")
+
+
+@read_only
+def get_grades_page(
+    db: Session,
+    limit: int = GRADES_PAGE_SIZE,
+    cursor: str = None,
+    student_id: int = None,
+    subject_id: int = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+):
+    """Return (grades, next_cursor) ordered by (date, id) descending using keyset pagination"""
+    limit = max(1, min(limit, MAX_GRADES_PAGE_SIZE))
+
+    statement = grade_rows_statement(student_id, subject_id, date_from, date_to)
+    if cursor:
+        cursor_date, cursor_id = decode_grade_cursor(cursor)
+        statement = statement.where(or_(
+            Grade.date < cursor_date,
+            and_(Grade.date == cursor_date, Grade.id < cursor_id)
+        ))
+
+    # Fetch one extra row to find out whether there is a next page
+    grades = db.execute(statement.order_by(Grade.date.desc(), Grade.id.desc()).limit(limit + 1)).all()
+    next_cursor = None
+    if len(grades) > limit:
+        grades = grades[:limit]
+        next_cursor = encode_grade_cursor(grades[-1])
+    return grades, next_cursor
+
+
+def grade_rows_statement(student_id: int = None, subject_id: int = None, date_from: datetime = None, date_to: datetime = None):
+    """Core select of flat grade rows joined to users and subjects"""
+    # Rows are plain tuples with attribute access (id, date, student_id,
+    # student, subject_id, subject, value): no identity map, no instrumentation
+    statement = (
+        select(
+            Grade.id, Grade.date, Grade.student_id, User.username.label("student"),
+            Grade.subject_id, Subject.name.label("subject"), Grade.value,
+        )
+        .join(User, User.id == Grade.student_id)
+        .join(Subject, Subject.id == Grade.subject_id)
+    )
+    if student_id is not None:
+        statement = statement.where(Grade.student_id == student_id)
+    if subject_id is not None:
+        statement = statement.where(Grade.subject_id == subject_id)
+    if date_from is not None:
+        statement = statement.where(Grade.date >= date_from)
+    if date_to is not None:
+        statement = statement.where(Grade.date < date_to)
+    return statement
+
+
+def grades_export_statement(student_id: int = None, subject_id: int = None, date_from: datetime = None, date_to: datetime = None):
+    return grade_rows_statement(student_id, subject_id, date_from, date_to).order_by(Grade.date, Grade.id)
+
+
+@read_only
+def get_subject_grade_columns(db: Session, subject_id: int):
+    # Two bare columns for analytics; no ORM objects are built
+    return db.execute(
+        select(Grade.student_id, Grade.value).where(Grade.subject_id == subject_id)
+    ).all()
+
+
+@read_only
+def get_usernames(db: Session, user_ids) -> dict:
+    if not user_ids:
+        return {}
+    return dict(db.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all())
+
+
+@read_only
 def get_average_grade_for_student(db: Session, student_id: int):
-    result = db.query(func.avg(Grade.value)).filter(Grade.student_id == student_id).scalar()
-    return result if result is not None else 0.0
-
-
+    # Read from the summary table instead of scanning the student's grades
+    stats = db.get(StudentStats, student_id)
+    return stats.grade_sum / stats.grade_count if stats and stats.grade_count else 0.0
+
+
+@read_only
+def get_subject_summary_for_student(db: Session, student_id: int):
+    """Average, count and latest grade of every subject for a student in one GROUP BY"""
+    # SQLite fills the bare Grade.value column from the row that produced
+    # max(date), which gives the latest grade without a second query
+    statement = (
+        select(
+            Subject.id.label("subject_id"),
+            Subject.name.label("subject"),
+            func.avg(Grade.value).label("average"),
+            func.count().label("count"),
+            Grade.value.label("latest_value"),
+            func.max(Grade.date).label("latest_date"),
+        )
+        .join(Subject, Subject.id == Grade.subject_id)
+        .where(Grade.student_id == student_id)
+        .group_by(Grade.subject_id)
+        .order_by(Subject.name)
+    )
+    return db.execute(statement).all()
+
+
+@read_only
 def get_average_grade_for_student_by_subject(db: Session, student_id: int, subject_id: int):
-    result = db.query(func.avg(Grade.value)).filter(
-        Grade.student_id == student_id,
-        Grade.subject_id == subject_id
-    ).scalar()
-    return result if result is not None else 0.0
\ No newline at end of file
+    stats = db.get(StudentSubjectStats, (student_id, subject_id))
+    return stats.grade_sum / stats.grade_count if stats and stats.grade_count else 0.0
\ No newline at end of file
@@ -15,13 +15,271 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from sqlalchemy import create_engine
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from config import get_config, DATABASE_PATH
+from tenants import current_tenant
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./users.db"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# One database file per school in multi-school mode (see tenants.py)
+TENANT_DIR = "schools"
+# Open per-school engines kept at once; "tenant_pool_size" in config.json overrides
+TENANT_POOL_SIZE = 32
+# Read-only connections per database; "reader_pool_size" in config.json overrides.
+# Writes go through a single connection, since SQLite has one writer anyway.
+READER_POOL_SIZE = 8
 
-Base = declarative_base()
\ No newline at end of file
+# Pragmas applied to every new SQLite connection. WAL lets dashboard reads run
+# while a grade is being written; busy_timeout makes a second writer wait for
+# the lock instead of failing with "database is locked". Any of them can be
+# overridden with a "sqlite_pragmas" object in config.json.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,  # negative means KiB, so about 16 MB per connection
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+
+def get_sqlite_pragmas() -> dict:
+    pragmas = dict(SQLITE_PRAGMAS)
+    config = get_config()
+    if config:
+        overrides = config.get("sqlite_pragmas", {})
+        # Only known pragmas with plain values, since they are formatted into SQL
+        pragmas.update({
+            name: value for name, value in overrides.items()
+            if name in SQLITE_PRAGMAS and str(value).lstrip("-").isalnum()
+        })
+    return pragmas
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in get_sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def apply_reader_pragmas(dbapi_connection, connection_record):
+    # journal_mode is a property of the file and can't be set read-only
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in get_sqlite_pragmas().items():
+            if name != "journal_mode":
+                cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.execute("PRAGMA query_only = ON")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite(engine, read_only: bool = False):
+    """Apply the pragma profile to every connection the engine opens"""
+    event.listen(engine, "connect", apply_reader_pragmas if read_only else apply_sqlite_pragmas)
+    return engine
+
+
+def _reader_pool_size() -> int:
+    config = get_config()
+    return max(1, int(config.get("reader_pool_size", READER_POOL_SIZE))) if config else READER_POOL_SIZE
+
+
+class Database:
+    """Sync and async engines and session factories for one SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.engine = configure_sqlite(create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}))
+        # Loaded objects stay usable after commit, so handlers can end a transaction
+        # (and return the connection to the pool) before awaiting slow work
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+        # Async engines used by the request handlers; the sync engine is kept
+        # for startup, migrations and command line tools. The writer is one
+        # connection, so writes queue in the pool instead of on the SQLite
+        # lock; readers open the file with mode=ro and never wait for it (WAL).
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=1, max_overflow=0)
+        configure_sqlite(self.async_engine.sync_engine)
+        self.WriteSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        self.reader_engine = create_async_engine(
+            f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true",
+            pool_size=_reader_pool_size(),
+            max_overflow=0,
+        )
+        configure_sqlite(self.reader_engine.sync_engine, read_only=True)
+        self.ReadSessionLocal = async_sessionmaker(
+            self.reader_engine, autoflush=False, expire_on_commit=False, info={"read_only": True}
+        )
+        # Sessions currently open; engines in use are never evicted
+        self.active = 0
+        # Set by prepare() once the schema is current
+        self.ready = False
+        self._prepare_lock = threading.Lock()
+
+    def prepare(self):
+        """Migrate to the current schema; a new file also gets the default subjects"""
+        with self._prepare_lock:
+            if self.ready:
+                return
+            # Imported here: both import models, which import Base from this module
+            from migrations import upgrade
+            from crud_ops import create_default_subjects
+            exists = os.path.exists(self.path)
+            upgrade(self.engine)
+            if not exists:
+                db = self.SessionLocal()
+                try:
+                    create_default_subjects(db)
+                finally:
+                    db.close()
+            self.ready = True
+
+    def dispose(self):
+        self.engine.dispose()
+        for async_engine in (self.async_engine, self.reader_engine):
+            try:
+                task = asyncio.get_running_loop().create_task(async_engine.dispose())
+            except RuntimeError:
+                asyncio.run(async_engine.dispose())
+            else:
+                # The loop only keeps weak references to tasks
+                _dispose_tasks.add(task)
+                task.add_done_callback(_dispose_tasks.discard)
+
+    async def dispose_async(self):
+        self.engine.dispose()
+        await self.async_engine.dispose()
+        await self.reader_engine.dispose()
+
+
+_dispose_tasks = set()
+
+
+_default_database = Database(DATABASE_PATH)
+engine = _default_database.engine
+SessionLocal = _default_database.SessionLocal
+async_engine = _default_database.async_engine
+reader_engine = _default_database.reader_engine
+WriteSessionLocal = AsyncSessionLocal = _default_database.WriteSessionLocal
+ReadSessionLocal = _default_database.ReadSessionLocal
+
+_tenant_databases = OrderedDict()
+_tenant_lock = threading.Lock()
+
+Base = declarative_base()
+
+
+def database_path(tenant: Optional[str] = None) -> str:
+    return DATABASE_PATH if tenant is None else os.path.join(TENANT_DIR, f"{tenant}.db")
+
+
+def _pool_size() -> int:
+    config = get_config()
+    return max(1, int(config.get("tenant_pool_size", TENANT_POOL_SIZE))) if config else TENANT_POOL_SIZE
+
+
+def _cached_database(tenant: str) -> Optional[Database]:
+    with _tenant_lock:
+        database = _tenant_databases.get(tenant)
+        if database is None or not database.ready:
+            return None
+        _tenant_databases.move_to_end(tenant)
+        return database
+
+
+def _open_database(tenant: str):
+    """Return (database, evicted databases) with the school's database migrated"""
+    with _tenant_lock:
+        database = _tenant_databases.get(tenant)
+        evicted = []
+        if database is not None:
+            _tenant_databases.move_to_end(tenant)
+        else:
+            os.makedirs(TENANT_DIR, exist_ok=True)
+            database = Database(database_path(tenant))
+            _tenant_databases[tenant] = database
+            excess = len(_tenant_databases) - _pool_size()
+            # A database still being prepared by another caller is never idle
+            idle = [
+                name for name, db in _tenant_databases.items()
+                if db.active == 0 and db.ready and name != tenant
+            ]
+            evicted = [_tenant_databases.pop(name) for name in idle[:max(0, excess)]]
+    database.prepare()
+    return database, evicted
+
+
+def get_database(tenant: Optional[str] = None) -> Database:
+    """Engines for a school, opened on first use and migrated to the current schema.
+
+    A school's database is created on first use with the default subjects; the
+    admin from config.json is added on their first login. Schools get separate
+    files and engines, so a write lock held in one never delays another. The
+    least recently used idle engines are closed once more than the pool size
+    are open.
+    """
+    if tenant is None:
+        return _default_database
+    database, evicted = _open_database(tenant)
+    for stale in evicted:
+        stale.dispose()
+    return database
+
+
+async def get_database_async(tenant: Optional[str] = None) -> Database:
+    """get_database for request handlers: opening and migrating a school's file
+    runs in a worker thread, and evicted engines are closed before returning"""
+    if tenant is None:
+        return _default_database
+    database = _cached_database(tenant)
+    if database is None:
+        database, evicted = await asyncio.to_thread(_open_database, tenant)
+        for stale in evicted:
+            await stale.dispose_async()
+    return database
+
+
+def current_database() -> Database:
+    """Database of the school the current request belongs to"""
+    return get_database(current_tenant())
+
+
+async def current_database_async() -> Database:
+    return await get_database_async(current_tenant())
+
+
+@asynccontextmanager
+async def open_session(read_only: bool = False):
+    """AsyncSession on the current school's database, counted as in use"""
+    database = await current_database_async()
+    database.active += 1
+    try:
+        factory = database.ReadSessionLocal if read_only else database.WriteSessionLocal
+        async with factory() as db:
+            yield db
+    finally:
+        database.active -= 1
+
+
+# Route dependencies: every handler declares whether it writes
+async def get_read_db():
+    async with open_session(read_only=True) as db:
+        yield db
+
+
+async def get_write_db():
+    async with open_session() as db:
+        yield db
@@ -0,0 +1,60 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+from instrumentation import instrument_templates
+
+templates = instrument_templates(Jinja2Templates(directory="templates"))
+
+# Compiled once; only the message is escaped and substituted per error
+_error_template = templates.get_template("error.html")
+
+# Details that mean "no such page" rather than carrying a specific message
+NOT_FOUND_DETAILS = ("Not Found", "Page not found")
+
+
+def render_error(message: str) -> bytes:
+    return _error_template.render(message=message).encode("utf-8")
+
+
+def _json_body(detail) -> bytes:
+    return json.dumps({"detail": detail}, ensure_ascii=False, default=str).encode("utf-8")
+
+
+# Bot scans produce floods of 404s, so both bodies are encoded only once
+_NOT_FOUND_HTML = render_error("HTTP Error 404: Page not found")
+_NOT_FOUND_JSON = _json_body(NOT_FOUND_DETAILS[0])
+
+
+def wants_json(request: Request) -> bool:
+    return "application/json" in request.headers.get("accept", "")
+
+
+def error_response(request: Request, status_code: int, message: str, detail=None, headers=None) -> Response:
+    """HTML alert page, or {"detail": ...} for API clients; detail defaults to message"""
+    if wants_json(request):
+        body = _json_body(message if detail is None else detail)
+        return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+    return HTMLResponse(content=render_error(message), status_code=status_code, headers=headers)
+
+
+def not_found_response(request: Request, headers=None) -> Response:
+    if wants_json(request):
+        return Response(content=_NOT_FOUND_JSON, status_code=404, headers=headers, media_type="application/json")
+    return HTMLResponse(content=_NOT_FOUND_HTML, status_code=404, headers=headers)
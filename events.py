@@ -0,0 +1,36 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import defaultdict
+
+# Topics published by crud_ops after a successful commit
+USER_CHANGED = "user_changed"  # user_id
+GRADES_CHANGED = "grades_changed"  # student_ids, subject_ids
+USERS_ADDED = "users_added"  # count
+SUBJECTS_CHANGED = "subjects_changed"  # subject_id
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(topic: str, callback):
+    """Call callback(**payload) every time topic is published"""
+    _subscribers[topic].append(callback)
+
+
+def publish(topic: str, **payload):
+    for callback in _subscribers[topic]:
+        callback(**payload)
@@ -0,0 +1,68 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import csv
+import io
+import json
+from database import open_session
+from crud_ops import grades_export_statement
+
+# Rows fetched from the server-side cursor per chunk of output
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = ("id", "date", "student_id", "student", "subject_id", "subject", "value")
+
+
+async def _grade_batches(filters: dict):
+    # The export owns its session: it outlives the request handler while the
+    # response body is being streamed
+    async with open_session(read_only=True) as db:
+        statement = grades_export_statement(**filters).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        result = await db.stream(statement)
+        async for rows in result.partitions():
+            yield rows
+
+
+async def grades_csv(filters: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in _grade_batches(filters):
+        for row in rows:
+            writer.writerow((row.id, row.date.isoformat() if row.date else "", row.student_id,
+                             row.student, row.subject_id, row.subject, row.value))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def grades_ndjson(filters: dict):
+    async for rows in _grade_batches(filters):
+        yield "".join(
+            json.dumps({
+                "id": row.id,
+                "date": row.date.isoformat() if row.date else None,
+                "student_id": row.student_id,
+                "student": row.student,
+                "subject_id": row.subject_id,
+                "subject": row.subject,
+                "value": row.value,
+            }, ensure_ascii=False) + "\n"
+            for row in rows
+        )
@@ -0,0 +1,148 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+from config import get_config
+from database import open_session
+from tenants import current_tenant, set_current_tenant
+
+# Defaults; "group_commit" in config.json overrides either key
+GROUP_COMMIT = {
+    "max_ops": 64,        # flush once this many writes are waiting
+    "max_delay_ms": 5,    # or once the oldest has waited this long
+}
+
+logger = logging.getLogger("openschool.group_commit")
+_reported = set()
+
+
+def _settings() -> dict:
+    config = get_config()
+    overrides = config.get("group_commit", {}) if config else {}
+    settings = dict(GROUP_COMMIT)
+    # A malformed value falls back to the default instead of stopping the writer
+    for key, convert, minimum in (("max_ops", int, 1), ("max_delay_ms", float, 0)):
+        try:
+            settings[key] = max(minimum, convert(overrides.get(key, GROUP_COMMIT[key])))
+        except (TypeError, ValueError):
+            if (key, repr(overrides.get(key))) not in _reported:
+                _reported.add((key, repr(overrides.get(key))))
+                logger.warning("Ignoring invalid group_commit.%s: %r", key, overrides.get(key))
+    return settings
+
+
+class GroupCommitWriter:
+    """Runs queued writes for one database from a single task, committing them
+    in groups so a burst of grades costs a handful of fsyncs, not one each"""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self._run())
+        self.commits = 0
+        self.operations = 0
+
+    async def submit(self, fn, *args):
+        """Queue fn(session, *args); resolves with its result once committed"""
+        future = self.loop.create_future()
+        self.queue.put_nowait((fn, args, future))
+        return await future
+
+    async def _run(self):
+        # The task's own context: events published on commit see this school
+        set_current_tenant(self.tenant)
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                settings = _settings()
+                deadline = self.loop.time() + settings["max_delay_ms"] / 1000
+                while len(batch) < settings["max_ops"]:
+                    if not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                        continue
+                    timeout = deadline - self.loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._flush(batch)
+            except Exception as e:
+                # Opening the database or rolling back failed: fail this batch's
+                # callers and keep serving, rather than leave them waiting forever
+                logger.exception("Group commit for school %s failed", self.tenant)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, batch: list):
+        async with open_session() as db:
+            try:
+                results = await db.run_sync(lambda session: [fn(session, *args) for fn, args, _ in batch])
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                results = None
+
+            if results is not None:
+                self.commits += 1
+                self.operations += len(batch)
+                for (_, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+
+            # Something in the group failed: commit each write on its own so
+            # only the caller whose write is invalid gets the error
+            for fn, args, future in batch:
+                try:
+                    result = await db.run_sync(fn, *args)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.commits += 1
+                    self.operations += 1
+                    if not future.done():
+                        future.set_result(result)
+
+
+_writers = {}
+
+
+def get_writer() -> GroupCommitWriter:
+    """Writer for the current school, started on first use in this event loop"""
+    tenant = current_tenant()
+    writer = _writers.get(tenant)
+    if writer is None or writer.loop is not asyncio.get_running_loop() or writer.task.done():
+        writer = _writers[tenant] = GroupCommitWriter(tenant)
+    return writer
+
+
+async def submit(fn, *args):
+    return await get_writer().submit(fn, *args)
+
+
+def get_group_commit_stats() -> dict:
+    return {
+        str(tenant): {"commits": writer.commits, "operations": writer.operations, "queued": writer.queue.qsize()}
+        for tenant, writer in _writers.items()
+    }
@@ -0,0 +1,99 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import get_config
+from instrumentation import record_hash_time
+from passwords import get_password_hash, verify_password, verify_and_update_password
+
+
+def _configured_concurrency() -> int:
+    # "password_hash_concurrency" in config.json caps how many Argon2 hashes run at once
+    default = os.cpu_count() or 2
+    config = get_config()
+    if not config:
+        return default
+    return max(1, int(config.get("password_hash_concurrency", default)))
+
+
+HASH_CONCURRENCY = _configured_concurrency()
+
+# argon2-cffi releases the GIL while hashing, so threads run hashes in parallel
+# and the event loop keeps serving other requests in the meantime
+_executor = ThreadPoolExecutor(max_workers=HASH_CONCURRENCY, thread_name_prefix="password-hash")
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "running": 0, "completed": 0}
+
+
+def _run_counted(fn, *args):
+    with _stats_lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+    try:
+        return fn(*args)
+    finally:
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["completed"] += 1
+
+
+async def _submit(fn, *args):
+    with _stats_lock:
+        _stats["queued"] += 1
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, _run_counted, fn, *args)
+    finally:
+        # Includes queueing, which is what the request actually waits for
+        record_hash_time(time.perf_counter() - started)
+
+
+def get_hash_pool_stats() -> dict:
+    """Snapshot of the hashing pool: queue depth, running hashes and totals"""
+    with _stats_lock:
+        return dict(_stats, concurrency=HASH_CONCURRENCY)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _submit(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _submit(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    return await _submit(verify_and_update_password, plain_password, hashed_password)
+
+
+_dummy_hash = None
+
+
+async def verify_dummy_password_async(plain_password: str) -> bool:
+    """Spend the same Argon2 work as a real verify, for logins with an unknown
+    username, so response time does not reveal which usernames exist"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async(secrets.token_hex(16))
+    await verify_password_async(plain_password, _dummy_hash)
+    return False
@@ -0,0 +1,244 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import csv
+import os
+import secrets
+import tempfile
+import time
+from datetime import datetime
+from itertools import islice
+import bleach
+from cache import LRUCache
+from database import open_session
+from tenants import current_tenant
+from hashing import HASH_CONCURRENCY, hash_password_async
+import crud_async
+
+# Rows per transaction; each batch costs one username query and one executemany
+IMPORT_BATCH_SIZE = 500
+# Keep at most this many per-row errors in memory for the report
+MAX_REPORTED_ERRORS = 1000
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Imports may keep at most half of the hashing pool busy, shared by all running
+# imports, so logins queue behind a few import hashes rather than a whole batch
+_import_hash_slots = asyncio.Semaphore(max(1, HASH_CONCURRENCY // 2))
+
+USER_COLUMNS = ("username", "password", "role")
+GRADE_COLUMNS = ("username", "subject", "value", "date")
+
+
+class ImportJob:
+    def __init__(self, kind: str, filename: str):
+        self.id = secrets.token_urlsafe(8)
+        self.kind = kind
+        self.filename = filename
+        self.status = "running"
+        self.processed = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def add_error(self, row_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "processed": self.processed,
+            "created": self.created,
+            "error_count": self.error_count,
+            "errors": [{"row": row, "error": message} for row, message in self.errors],
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_jobs = LRUCache(maxsize=100)
+
+
+def get_job(job_id: str):
+    # Jobs are only visible from the school that started them
+    return _jobs.get((current_tenant(), job_id))
+
+
+def _iter_csv(path: str):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        # Spreadsheet exports in the ru locale use ";" as the separator
+        delimiter = ";" if ";" in f.readline() else ","
+        f.seek(0)
+        yield from csv.reader(f, delimiter=delimiter)
+
+
+def _iter_xlsx(path: str):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Для импорта XLSX установите пакет openpyxl")
+    # read_only mode streams rows instead of loading the whole sheet
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if cell is None else cell for cell in row]
+    finally:
+        workbook.close()
+
+
+def _iter_records(path: str, filename: str, columns: tuple):
+    """Yield (row number, dict) for every data row; the first row is the header"""
+    rows = _iter_xlsx(path) if filename.lower().endswith(".xlsx") else _iter_csv(path)
+    header = [str(cell).strip().lower() for cell in next(rows, [])]
+    missing = [column for column in columns if column not in header and column != "date"]
+    if missing:
+        raise ValueError(f"В файле нет столбцов: {', '.join(missing)}")
+    for number, row in enumerate(rows, start=2):
+        if not any(str(cell).strip() for cell in row):
+            continue
+        yield number, {name: row[index] if index < len(row) else "" for index, name in enumerate(header)}
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    for date_format in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError(f"Некорректная дата: {value}")
+
+
+async def _hash_for_import(password: str) -> str:
+    async with _import_hash_slots:
+        return await hash_password_async(password)
+
+
+async def _import_users(job: ImportJob, db, batch: list, seen: set):
+    candidates = []
+    for number, record in batch:
+        username = bleach.clean(str(record.get("username", "")).strip())
+        password = str(record.get("password", ""))
+        role = str(record.get("role", "") or "student").strip()
+        if not username or not password:
+            job.add_error(number, "Не указано имя пользователя или пароль")
+        elif role not in ("student", "teacher"):
+            job.add_error(number, f"Неизвестная роль: {role}")
+        elif username in seen:
+            job.add_error(number, f"Пользователь {username} повторяется в файле")
+        else:
+            seen.add(username)
+            candidates.append((number, username, password, role))
+
+    existing = await crud_async.get_existing_usernames(db, [username for _, username, _, _ in candidates])
+    # Free the single writer connection while the batch is hashed
+    await db.commit()
+    rows = []
+    for number, username, password, role in candidates:
+        if username in existing:
+            job.add_error(number, f"Пользователь {username} уже существует")
+        else:
+            rows.append((username, password, role))
+
+    # Hashes run in parallel in the hashing pool, a few at a time
+    hashes = await asyncio.gather(*(_hash_for_import(password) for _, password, _ in rows))
+    if rows:
+        job.created += await crud_async.insert_users(db, [
+            {"username": username, "hashed_password": hashed, "role": role}
+            for (username, _, role), hashed in zip(rows, hashes)
+        ])
+
+
+async def _import_grades(job: ImportJob, db, batch: list, subjects: dict):
+    student_ids = await crud_async.get_student_ids_by_username(
+        db, {str(record.get("username", "")).strip() for _, record in batch}
+    )
+    rows = []
+    for number, record in batch:
+        username = str(record.get("username", "")).strip()
+        subject = str(record.get("subject", "")).strip()
+        try:
+            value = float(record.get("value", ""))
+        except ValueError:
+            job.add_error(number, "Оценка должна быть числом")
+            continue
+        try:
+            date = _parse_date(record.get("date", ""))
+        except ValueError as e:
+            job.add_error(number, str(e))
+            continue
+        if username not in student_ids:
+            job.add_error(number, f"Ученик {username} не найден")
+        elif subject not in subjects:
+            job.add_error(number, f"Предмет {subject} не найден")
+        elif value < 1 or value > 5:
+            job.add_error(number, "Оценка должна быть от 1 до 5")
+        else:
+            rows.append({"student_id": student_ids[username], "subject_id": subjects[subject], "value": value, "date": date})
+    if rows:
+        job.created += await crud_async.insert_grades(db, rows)
+
+
+async def _run(job: ImportJob, path: str):
+    try:
+        columns = USER_COLUMNS if job.kind == "users" else GRADE_COLUMNS
+        records = _iter_records(path, job.filename, columns)
+        async with open_session() as db:
+            seen = set()
+            subjects = {subject.name: subject.id for subject in await crud_async.get_subjects(db)}
+            while True:
+                # Parsing happens off the event loop, one batch at a time,
+                # without holding the writer connection
+                await db.commit()
+                batch = await asyncio.to_thread(lambda: list(islice(records, IMPORT_BATCH_SIZE)))
+                if not batch:
+                    break
+                if job.kind == "users":
+                    await _import_users(job, db, batch, seen)
+                else:
+                    await _import_grades(job, db, batch, subjects)
+                job.processed += len(batch)
+        job.status = "done"
+    except Exception as e:
+        job.add_error(0, str(e))
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+        os.unlink(path)
+
+
+async def start_import(kind: str, upload) -> ImportJob:
+    """Spool the upload to a temporary file and import it in a background task"""
+    job = ImportJob(kind, upload.filename or "upload.csv")
+    suffix = ".xlsx" if job.filename.lower().endswith(".xlsx") else ".csv"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+    _jobs.set((current_tenant(), job.id), job)
+    job.task = asyncio.create_task(_run(job, f.name))
+    return job
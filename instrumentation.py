@@ -0,0 +1,368 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Optional
+import jinja2
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import get_config
+
+logger = logging.getLogger("openschool.instrumentation")
+
+# Latency histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Defaults; "profiling" in config.json overrides any of these keys. When
+# enabled, the event loop thread is sampled during every request and requests
+# slower than the threshold leave a collapsed-stack file (one "a;b;c count"
+# line per stack) that flamegraph.pl or speedscope can render.
+PROFILING = {
+    "enabled": False,
+    "threshold_ms": 500,
+    "interval_ms": 5,
+    "directory": "profiles",
+}
+
+# Only these clients may read /metrics unless "metrics_allow" in config.json says otherwise
+METRICS_ALLOW = ["127.0.0.1", "::1"]
+
+
+class RequestStats:
+    """Timings collected while one request is served"""
+
+    __slots__ = ("started", "db_time", "statements", "slowest_time", "slowest_statement", "render_time", "hash_time")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.statements = 0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.render_time = 0.0
+        self.hash_time = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_hash_time(elapsed: float):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.hash_time += elapsed
+
+
+# SQL timing for every engine, including the per-school and reader engines.
+# Statements run by the group commit writer belong to no request and are not counted.
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Statements on one connection never overlap, so one start time is enough;
+    # a failed statement's is simply overwritten by the next one
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started")
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.db_time += elapsed
+        stats.statements += 1
+        if elapsed > stats.slowest_time:
+            stats.slowest_time, stats.slowest_statement = elapsed, statement
+
+
+class TimedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.render_time += time.perf_counter() - started
+
+
+def instrument_templates(templates):
+    """Time renders of every template loaded through this Jinja2Templates from now on"""
+    templates.env.template_class = TimedTemplate
+    return templates
+
+
+class _RouteMetrics:
+    __slots__ = ("count", "buckets", "total", "db_time", "statements", "render_time", "hash_time", "slowest_statement")
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.total = 0.0
+        self.db_time = 0.0
+        self.statements = 0
+        self.render_time = 0.0
+        self.hash_time = 0.0
+        self.slowest_statement = 0.0
+
+
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(_RouteMetrics)
+
+
+def _record(route: str, method: str, status: int, stats: RequestStats, elapsed: float):
+    with _metrics_lock:
+        metrics = _metrics[(route, method, status)]
+        metrics.count += 1
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if elapsed <= bound:
+                metrics.buckets[index] += 1
+        metrics.total += elapsed
+        metrics.db_time += stats.db_time
+        metrics.statements += stats.statements
+        metrics.render_time += stats.render_time
+        metrics.hash_time += stats.hash_time
+        metrics.slowest_statement = max(metrics.slowest_statement, stats.slowest_time)
+
+
+def _labels(route: str, method: str, status: int) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'route="{route}",method="{method}",status="{status}"'
+
+
+def _format(value) -> str:
+    return f"{value:.6f}" if isinstance(value, float) else str(value)
+
+
+def render_metrics(extra_gauges: dict = None, extra_counters: dict = None) -> str:
+    """Prometheus text exposition of the per-route request metrics"""
+    lines = [
+        "# HELP openschool_request_duration_seconds Time to serve a request.",
+        "# TYPE openschool_request_duration_seconds histogram",
+    ]
+    with _metrics_lock:
+        snapshot = {key: (metrics.count, list(metrics.buckets), metrics.total, metrics.db_time, metrics.statements,
+                          metrics.render_time, metrics.hash_time, metrics.slowest_statement)
+                    for key, metrics in _metrics.items()}
+    for key, (count, buckets, total, *_) in sorted(snapshot.items()):
+        labels = _labels(*key)
+        for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+            lines.append(f'openschool_request_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+        lines.append(f'openschool_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"openschool_request_duration_seconds_sum{{{labels}}} {total:.6f}")
+        lines.append(f"openschool_request_duration_seconds_count{{{labels}}} {count}")
+
+    counters = (
+        ("openschool_db_seconds_total", "Time spent executing SQL.", 3),
+        ("openschool_sql_statements_total", "SQL statements executed.", 4),
+        ("openschool_template_render_seconds_total", "Time spent rendering templates.", 5),
+        ("openschool_password_hash_seconds_total", "Time spent waiting for password hashing.", 6),
+    )
+    for name, description, index in counters:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        for key, values in sorted(snapshot.items()):
+            lines.append(f"{name}{{{_labels(*key)}}} {_format(values[index])}")
+
+    lines += [
+        "# HELP openschool_sql_slowest_statement_seconds Slowest single SQL statement seen.",
+        "# TYPE openschool_sql_slowest_statement_seconds gauge",
+    ]
+    for key, values in sorted(snapshot.items()):
+        lines.append(f"openschool_sql_slowest_statement_seconds{{{_labels(*key)}}} {_format(values[7])}")
+
+    for name, (description, value) in (extra_gauges or {}).items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {_format(value)}"]
+    for name, (description, value) in (extra_counters or {}).items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter", f"{name} {_format(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_allowed(client_host: Optional[str]) -> bool:
+    config = get_config()
+    allowed = config.get("metrics_allow", METRICS_ALLOW) if config else METRICS_ALLOW
+    return "*" in allowed or client_host in allowed
+
+
+def _profiling() -> dict:
+    config = get_config()
+    overrides = config.get("profiling", {}) if config else {}
+    return dict(PROFILING, **overrides)
+
+
+class _Profile:
+    __slots__ = ("thread_id", "loop", "samples", "dropped")
+
+    def __init__(self, thread_id: int, loop):
+        self.thread_id = thread_id
+        self.loop = loop
+        self.samples = Counter()
+        # Ticks not attributed because other requests were in flight
+        self.dropped = 0
+
+
+class _Sampler(threading.Thread):
+    """Samples the event loop thread on behalf of profiled requests.
+
+    Every request shares that thread, so a stack is only attributed to a
+    request while it is the only one in flight and a task is running; ticks
+    spent idle in the selector (waiting on SQL or the hashing pool) or while
+    other requests overlap are not recorded.
+    """
+
+    def __init__(self):
+        super().__init__(name="request-sampler", daemon=True)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wakeup = threading.Event()
+        self.interval = PROFILING["interval_ms"] / 1000
+
+    def add(self, key, thread_id: int, loop) -> _Profile:
+        profile = _Profile(thread_id, loop)
+        with self.lock:
+            self.active[key] = profile
+        self.wakeup.set()
+        return profile
+
+    def remove(self, key):
+        with self.lock:
+            self.active.pop(key, None)
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                if not self.active:
+                    self.wakeup.clear()
+                    continue
+                if len(self.active) > 1:
+                    for profile in self.active.values():
+                        profile.dropped += 1
+                    continue
+                for profile in self.active.values():
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None and asyncio.current_task(profile.loop) is not None:
+                        profile.samples[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+_sampler: Optional[_Sampler] = None
+
+
+def _get_sampler(interval_ms: float) -> _Sampler:
+    global _sampler
+    if _sampler is None:
+        _sampler = _Sampler()
+        _sampler.interval = interval_ms / 1000
+        _sampler.start()
+    return _sampler
+
+
+def _dump_profile(directory: str, route: str, elapsed: float, profile: _Profile):
+    os.makedirs(directory, exist_ok=True)
+    name = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    # The random suffix keeps slow requests finishing in the same second, in
+    # this worker or another, from overwriting each other's profiles
+    path = os.path.join(
+        directory,
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(elapsed * 1000)}ms-{secrets.token_hex(4)}.folded",
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in profile.samples.most_common():
+            f.write(f"{stack} {count}\n")
+    logger.info("Slow request %s took %.0f ms; profile written to %s", route, elapsed * 1000, path)
+    if profile.dropped:
+        logger.info("%d sample(s) of %s dropped while other requests were running", profile.dropped, route)
+
+
+def _route_name(scope) -> str:
+    # Route templates rather than raw paths, so label cardinality stays bounded
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "/static" if scope["path"].startswith("/static/") else "unmatched"
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        if getattr(route, "endpoint", None) is endpoint:
+            return route.path
+    return getattr(endpoint, "__name__", "unknown")
+
+
+class InstrumentationMiddleware:
+    """Per-request timings: Server-Timing headers, /metrics and slow-request profiles"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        profiling = _profiling()
+        profile = None
+        if profiling["enabled"]:
+            sampler = _get_sampler(profiling["interval_ms"])
+            profile = sampler.add(id(stats), threading.get_ident(), asyncio.get_running_loop())
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = (time.perf_counter() - stats.started) * 1000
+                timing = (
+                    f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries", '
+                    f"render;dur={stats.render_time * 1000:.1f}, "
+                    f"hash;dur={stats.hash_time * 1000:.1f}, "
+                    f"total;dur={total:.1f}"
+                )
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            elapsed = time.perf_counter() - stats.started
+            route = _route_name(scope)
+            _record(route, scope["method"], status, stats, elapsed)
+            if profile is not None:
+                _sampler.remove(id(stats))
+                if elapsed * 1000 >= profiling["threshold_ms"] and (profile.samples or profile.dropped):
+                    if profile.samples:
+                        _dump_profile(profiling["directory"], route, elapsed, profile)
+                    else:
+                        logger.info("Slow request %s took %.0f ms; not profiled, other requests were running",
+                                    route, elapsed * 1000)
+                    if stats.slowest_statement:
+                        logger.info("Slowest statement (%.1f ms): %s", stats.slowest_time * 1000, stats.slowest_statement)
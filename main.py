@@ -15,23 +15,28 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends
 from fastapi.staticfiles import StaticFiles
 from database import engine
-from models import Base
+from migrations import upgrade
+from config import get_config, get_admin_username, is_setup_done
 from router_auth import router as auth_router
 from router_views import router as views_router
-from crud_ops import create_user, get_user_by_username, create_subject, get_subject_by_name, get_user
-from fastapi.responses import HTMLResponse, RedirectResponse
+from router_auth import get_current_user
+from sessions import SESSION_COOKIE
+import page_cache
+import errors
+from crud_ops import create_user, get_user_by_username, create_default_subjects, get_user
+from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 import traceback
 from starlette.exceptions import HTTPException
 from fastapi.exceptions import RequestValidationError
-import os
-import json
 import bleach
-from sqlalchemy.orm import Session
-from database import SessionLocal as DatabaseSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal as DatabaseSessionLocal, get_read_db, current_database_async
+from tenants import TenantMiddleware
+from instrumentation import InstrumentationMiddleware, instrument_templates
 
 app = FastAPI()
 
@@ -39,129 +44,109 @@ app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Create templates object for rendering (moved before it's used)
-templates = Jinja2Templates(directory="templates")
+templates = instrument_templates(Jinja2Templates(directory="templates"))
 
 # Include auth router (always needed)
 app.include_router(auth_router, prefix="")
 
 # Dynamic route for home page that handles both setup and authentication
 @app.get("/")
-async def home(request: Request):
-    # Check if config.json and users.db exist
-    config_exists = os.path.exists("config.json")
-    db_exists = os.path.exists("users.db")
-    
-    if not config_exists or not db_exists:
+async def home(request: Request, db: AsyncSession = Depends(get_read_db)):
+    # Check if config.json and users.db exist (remembered once setup is done)
+    if not is_setup_done((await current_database_async()).path):
         # If either file is missing, show setup page
         return templates.TemplateResponse("first_start.html", {"request": request})
     else:
         # Files exist, check if user is authenticated
-        user_id = request.cookies.get("user_id")
-        user_role = request.cookies.get("user_role")
-        
-        if not user_id or not user_role:
+        if not request.cookies.get(SESSION_COOKIE):
             # User not authenticated, redirect to login
             return RedirectResponse(url="/login")
         
-        # User is authenticated, validate the user exists in database
-        db = DatabaseSessionLocal()
-        try:
-            from models import User
-            try:
-                user = db.query(User).filter(User.id == int(user_id)).first()
-                if not user:
-                    # User doesn't exist in database, redirect to login
-                    return RedirectResponse(url="/login")
-            except ValueError:
-                # Invalid user_id in cookie, redirect to login
-                return RedirectResponse(url="/login")
-        finally:
-            db.close()
-        
-        # User is authenticated and valid, show dashboard
-        from router_auth import get_current_user
-        from sqlalchemy.orm import sessionmaker
-        from database import SessionLocal
-        
-        db = SessionLocal()
+        # Resolve the signed session; the user record comes from the user cache
         try:
-            current_user = get_current_user(request, db)
+            current_user = await get_current_user(request, db)
             if not current_user:
+                # Invalid session or user doesn't exist, redirect to login
                 return RedirectResponse(url="/login")
-                
-            # Add Russian role translation
-            if current_user.role == "teacher":
-                current_user.role_ru = "учитель"
-            elif current_user.role == "student":
-                current_user.role_ru = "ученик"
-            else:
-                current_user.role_ru = current_user.role
 
-            if current_user.role == "teacher":
-                # Teacher view - show all grades
-                from crud_ops import get_all_grades, get_subjects
-                all_grades = get_all_grades(db)
-                students = db.query(User).filter(User.role == "student").all()
-                subjects = get_subjects(db)
-                
-                # Check if user is admin
-                is_admin = False
-                if os.path.exists("config.json"):
-                    with open("config.json", "r", encoding="utf-8") as f:
-                        config = json.load(f)
-                        admin_username = config.get("admin_username", "admin")
-                    is_admin = current_user.username == admin_username
-
-                return templates.TemplateResponse("dashboard.html", {
-                    "request": request,
-                    "current_user": current_user,
-                    "grades": all_grades,
-                    "students": students,
-                    "subjects": subjects,
-                    "is_admin": is_admin
-                })
-            elif current_user.role == "student":
-                # Student view - show only their grades
-                from crud_ops import get_grades_for_student, get_average_grade_for_student, get_subjects
-                student_grades = get_grades_for_student(db, current_user.id)
-                avg_grade = get_average_grade_for_student(db, current_user.id)
-                subjects = get_subjects(db)
-                
-                return templates.TemplateResponse("student.html", {
-                    "request": request,
-                    "current_user": current_user,
-                    "grades": student_grades,
-                    "average_grade": avg_grade,
-                    "subjects": subjects
-                })
-            else:
+            if current_user.role not in ("teacher", "student"):
                 return RedirectResponse(url="/login")
+
+            # Rendered pages are cached per user until a write touches their data
+            key = page_cache.page_key(current_user, request.url.query)
+            page = page_cache.get_page(key)
+            if page is None:
+                rendered_at = page_cache.generation(key)
+                if current_user.role == "teacher":
+                    html = await render_teacher_dashboard(request, db, current_user)
+                else:
+                    html = await render_student_dashboard(request, db, current_user)
+                page = page_cache.store_page(key, rendered_at, html)
+            return page_cache.page_response(request, page)
         except Exception as e:
             error = str(e)
             return templates.TemplateResponse("alert.html", {
                 "request": request,
                 "error": error
             })
-        finally:
-            db.close()
+
+async def render_teacher_dashboard(request: Request, db: AsyncSession, current_user) -> str:
+    # Teacher view - show one keyset page of grades
+    from crud_async import get_grades_page, get_students, get_subjects
+    from router_views import parse_grade_filters
+    filters = parse_grade_filters(request.query_params)
+    grades_page, next_cursor = await get_grades_page(db, **filters)
+    students = await get_students(db)
+    subjects = await get_subjects(db)
+
+    # Check if user is admin
+    is_admin = current_user.username == get_admin_username()
+
+    return templates.get_template("dashboard.html").render({
+        "request": request,
+        "current_user": current_user,
+        "grades": grades_page,
+        "next_cursor": next_cursor,
+        "filters": request.query_params,
+        "students": students,
+        "subjects": subjects,
+        "is_admin": is_admin
+    })
+
+
+async def render_student_dashboard(request: Request, db: AsyncSession, current_user) -> str:
+    # Student view - show only their grades
+    from crud_async import get_grades_for_student, get_average_grade_for_student, get_subjects, get_subject_summary_for_student
+    student_grades = await get_grades_for_student(db, current_user.id)
+    avg_grade = await get_average_grade_for_student(db, current_user.id)
+    subject_summary = await get_subject_summary_for_student(db, current_user.id)
+    subjects = await get_subjects(db)
+
+    return templates.get_template("student.html").render({
+        "request": request,
+        "current_user": current_user,
+        "grades": student_grades,
+        "average_grade": avg_grade,
+        "subject_summary": subject_summary,
+        "subjects": subjects
+    })
 
 # Include views router - this will only handle routes other than "/"
 # The "/" route is handled by the main app
 app.include_router(views_router, prefix="")
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and bring existing databases up to date
+upgrade(engine)
 
 # Initialize default users and subjects
 def init_db():
     db = DatabaseSessionLocal()
     try:
         # Get admin credentials from config.json
-        if os.path.exists("config.json"):
-            with open("config.json", "r", encoding="utf-8") as f:
-                config = json.load(f)
-                admin_username = bleach.clean(config.get("admin_username", "admin"))
-                admin_password = config.get("admin_password", "admin")
+        config = get_config()
+        if config:
+            admin_username = bleach.clean(config.admin_username)
+            admin_password = config.admin_password or "admin"
         else:
             # Default values if config doesn't exist
             admin_username = "admin"
@@ -178,19 +163,12 @@ def init_db():
             create_user(db, "user", "user", "student")
         
         # Create default subjects if they don't exist
-        subjects = ["Math", "Science", "English", "History"]
-        for subject_name in subjects:
-            subject = get_subject_by_name(db, subject_name)
-            if not subject:
-                create_subject(db, subject_name)
+        create_default_subjects(db)
     finally:
         db.close()
 
 # Check if config.json and users.db exist and initialize db if they exist
-config_exists = os.path.exists("config.json")
-db_exists = os.path.exists("users.db")
-
-if config_exists and db_exists:
+if is_setup_done():
     # Initialize the database when the app starts (only if files exist)
     init_db()
 
@@ -201,149 +179,33 @@ async def error_handler(request: Request, call_next):
         response = await call_next(request)
         return response
     except Exception as exc:
-        # Create JavaScript that will show the alert as a modal on the current page
-        js_alert = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Error - OpenSchool</title>
-            <link rel="stylesheet" type="text/css" href="/static/style.css">
-        </head>
-        <body>
-            <div class="modal-overlay"></div>
-            <div class="alert-modal">
-                <div class="alert-header">
-                    <span>Внимание!</span>
-                    <button onclick="closeAlert()" style="background: none; border: none; color: white; cursor: pointer;">×</button>
-                </div>
-                <div class="alert-body">
-                    <p>{bleach.clean(str(exc))}</p>
-                </div>
-                <div class="alert-footer">
-                    <button onclick="closeAlert()" class="btn">ОК</button>
-                </div>
-            </div>
-            <script>
-                function closeAlert() {{
-                    // Remove the modal and redirect to home
-                    window.location.href = '/';
-                }}
-            </script>
-        </body>
-        </html>
-        """
-        
-        return HTMLResponse(content=js_alert, status_code=500)
+        return errors.error_response(request, 500, str(exc))
 
 # Handle HTTP exceptions (like 404)
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    # Create JavaScript that will show the alert as a modal on the current page
-    js_alert = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Error - OpenSchool</title>
-        <link rel="stylesheet" type="text/css" href="/static/style.css">
-    </head>
-    <body>
-        <div class="modal-overlay"></div>
-        <div class="alert-modal">
-            <div class="alert-header">
-                <span>Внимание!</span>
-                <button onclick="closeAlert()" style="background: none; border: none; color: white; cursor: pointer;">×</button>
-            </div>
-            <div class="alert-body">
-                <p>HTTP Error {exc.status_code}: {bleach.clean(str(exc.detail))}</p>
-            </div>
-            <div class="alert-footer">
-                <button onclick="closeAlert()" class="btn">ОК</button>
-            </div>
-        </div>
-        <script>
-            function closeAlert() {{
-                // Remove the modal and redirect to home
-                window.location.href = '/';
-            }}
-        </script>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=js_alert, status_code=exc.status_code)
+    return errors.error_response(
+        request, exc.status_code, f"HTTP Error {exc.status_code}: {exc.detail}",
+        detail=exc.detail, headers=exc.headers,
+    )
 
 # Handle request validation errors
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    # Create JavaScript that will show the alert as a modal on the current page
-    js_alert = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Error - OpenSchool</title>
-        <link rel="stylesheet" type="text/css" href="/static/style.css">
-    </head>
-    <body>
-        <div class="modal-overlay"></div>
-        <div class="alert-modal">
-            <div class="alert-header">
-                <span>Внимание!</span>
-                <button onclick="closeAlert()" style="background: none; border: none; color: white; cursor: pointer;">×</button>
-            </div>
-            <div class="alert-body">
-                <p>Validation Error: {bleach.clean(str(exc))}</p>
-            </div>
-            <div class="alert-footer">
-                <button onclick="closeAlert()" class="btn">ОК</button>
-            </div>
-        </div>
-        <script>
-            function closeAlert() {{
-                // Remove the modal and redirect to home
-                window.location.href = '/';
-            }}
-        </script>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=js_alert, status_code=400)
+    return errors.error_response(request, 400, f"Validation Error: {exc}", detail=exc.errors())
 
 @app.exception_handler(404)
 async def custom_http_exception_handler(request: Request, exc):
-    # Create JavaScript that will show the alert as a modal on the current page
-    js_alert = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Error - OpenSchool</title>
-        <link rel="stylesheet" type="text/css" href="/static/style.css">
-    </head>
-    <body>
-        <div class="modal-overlay"></div>
-        <div class="alert-modal">
-            <div class="alert-header">
-                <span>Внимание!</span>
-                <button onclick="closeAlert()" style="background: none; border: none; color: white; cursor: pointer;">×</button>
-            </div>
-            <div class="alert-body">
-                <p>HTTP Error 404: Page not found</p>
-            </div>
-            <div class="alert-footer">
-                <button onclick="closeAlert()" class="btn">ОК</button>
-            </div>
-        </div>
-        <script>
-            function closeAlert() {{
-                // Remove the modal and redirect to home
-                window.location.href = '/';
-            }}
-        </script>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=js_alert, status_code=404)
+    # Unknown routes get the pre-encoded page; a 404 raised with its own
+    # message (e.g. a missing import job) still shows that message
+    if getattr(exc, "detail", None) in (None,) + errors.NOT_FOUND_DETAILS:
+        return errors.not_found_response(request, headers=getattr(exc, "headers", None))
+    return await http_exception_handler(request, exc)
+
+# Request timings wrap the routing (and the error pages), inside the school
+# selection; TenantMiddleware is outermost, so everything runs with the school selected
+app.add_middleware(InstrumentationMiddleware)
+app.add_middleware(TenantMiddleware)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,199 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import sys
+import time
+from database import get_database
+from migrations import upgrade, get_schema_version
+from tenants import get_tenant_ids, set_current_tenant
+
+
+def _open_school(school):
+    if school is not None and school not in get_tenant_ids():
+        raise SystemExit(f"Unknown school: {school}")
+    # Subscribers to crud_ops events key their caches by the current school
+    set_current_tenant(school)
+    return get_database(school)
+
+
+def migrate(args):
+    """Apply pending schema migrations to users.db or the school databases"""
+    schools = get_tenant_ids() if args.all_schools else [args.school]
+    for school in schools:
+        engine = _open_school(school).engine
+        upgrade(engine)
+        with engine.connect() as connection:
+            print(f"{engine.url.database} is at schema version {get_schema_version(connection)}.")
+    return 0
+
+
+def check_plans(args):
+    """Fail if any crud_ops query falls back to a full table scan"""
+    from query_plans import check_query_plans
+
+    database = _open_school(args.school)
+    upgrade(database.engine)
+    db = database.SessionLocal()
+    try:
+        problems = check_query_plans(db)
+    finally:
+        db.close()
+
+    for name, detail, statement in problems:
+        print(f"{name}: {detail}")
+        print(f"    {' '.join(statement.split())}")
+    if problems:
+        print(f"{len(problems)} full table scan(s) found.")
+        return 1
+    print("All checked queries use an index.")
+    return 0
+
+
+def check_queries(args):
+    """Fail if a dashboard or grade getter issues more SQL statements as rows grow"""
+    from query_counts import ROUNDS, check_query_counts
+
+    failed = False
+    for name, counts in check_query_counts().items():
+        rounds = ", ".join(f"{count} at {students}x{grades} grades" for count, (students, grades) in zip(counts, ROUNDS))
+        print(f"{name}: {rounds}")
+        failed = failed or len(set(counts)) > 1
+    if failed:
+        print("Statement count depends on the number of rows (N+1 query).")
+        return 1
+    print("Statement counts do not depend on the number of rows.")
+    return 0
+
+
+def rebuild_stats(args):
+    """Verify the grade summary tables against raw grades and rebuild them"""
+    from crud_ops import rebuild_grade_stats, verify_grade_stats
+
+    database = _open_school(args.school)
+    upgrade(database.engine)
+    db = database.SessionLocal()
+    try:
+        mismatches = verify_grade_stats(db)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} summary row(s) disagree with the grades table.")
+        if args.check:
+            return 1 if mismatches else 0
+        rebuild_grade_stats(db)
+        db.commit()
+        remaining = verify_grade_stats(db)
+    finally:
+        db.close()
+
+    print("Summary tables rebuilt." if not remaining else f"{len(remaining)} row(s) still disagree.")
+    return 1 if remaining else 0
+
+
+def _verify_p99_ms(params: dict, samples: int, concurrency: int) -> float:
+    from concurrent.futures import ThreadPoolExecutor
+    from passwords import make_context
+
+    context = make_context(params)
+    sample_hash = context.hash("calibration")
+
+    def timed(_):
+        started = time.perf_counter()
+        context.verify("calibration", sample_hash)
+        return time.perf_counter() - started
+
+    # Parallel verifies, like concurrent logins sharing the hashing pool
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = sorted(pool.map(timed, range(samples)))
+    return timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+
+
+def calibrate_hashing(args):
+    """Measure Argon2 latency on this host and recommend cost parameters"""
+    from config import get_config, save_config
+    from passwords import get_hash_params
+
+    current = get_hash_params()
+    parallelism = args.parallelism or current["parallelism"]
+    print(f"Current parameters: {current}, p99 {_verify_p99_ms(current, args.samples, args.concurrency):.1f} ms")
+
+    # Raise time_cost for each memory size until the verify p99 passes the
+    # target; the strongest combination that still fits is recommended
+    best = None
+    memory_cost = 1024
+    while memory_cost <= args.max_memory:
+        fitting = None
+        for time_cost in range(1, args.max_time_cost + 1):
+            params = {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism}
+            p99 = _verify_p99_ms(params, args.samples, args.concurrency)
+            print(f"  memory_cost={memory_cost:<7} time_cost={time_cost:<3} p99 {p99:8.1f} ms")
+            if p99 > args.target_ms:
+                break
+            fitting = params
+        if fitting is None:
+            break
+        if best is None or fitting["time_cost"] * fitting["memory_cost"] >= best["time_cost"] * best["memory_cost"]:
+            best = fitting
+        memory_cost *= 4
+
+    if best is None:
+        print(f"No parameters verify within {args.target_ms} ms at p99 on this host.")
+        return 1
+    print("Recommended config.json entry:")
+    print(json.dumps({"password_hashing": best}, indent=4))
+    if args.save:
+        config = get_config()
+        if not config:
+            print("config.json does not exist yet; run setup first.")
+            return 1
+        save_config(dict(config.raw, password_hashing=best))
+        print("Saved; existing hashes are upgraded as users log in.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenSchool maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    # Commands that touch a database work on users.db unless a school is given
+    school = argparse.ArgumentParser(add_help=False)
+    school.add_argument("--school", default=None, help="school id from the \"tenants\" config")
+    migrate_parser = commands.add_parser("migrate", parents=[school], help=migrate.__doc__)
+    migrate_parser.add_argument("--all-schools", action="store_true", help="migrate every configured school")
+    migrate_parser.set_defaults(handler=migrate)
+    commands.add_parser("check-plans", parents=[school], help=check_plans.__doc__).set_defaults(handler=check_plans)
+    commands.add_parser("check-queries", help=check_queries.__doc__).set_defaults(handler=check_queries)
+    rebuild = commands.add_parser("rebuild-stats", parents=[school], help=rebuild_stats.__doc__)
+    rebuild.add_argument("--check", action="store_true", help="only report mismatches, do not rebuild")
+    rebuild.set_defaults(handler=rebuild_stats)
+    calibrate = commands.add_parser("calibrate-hashing", help=calibrate_hashing.__doc__)
+    calibrate.add_argument("--target-ms", type=float, default=250.0, help="login verify p99 to stay under")
+    calibrate.add_argument("--concurrency", type=int, default=os.cpu_count() or 2, help="verifies run in parallel while measuring")
+    calibrate.add_argument("--samples", type=int, default=50, help="verifies measured per candidate")
+    calibrate.add_argument("--parallelism", type=int, default=None, help="Argon2 lanes (default: current setting)")
+    calibrate.add_argument("--max-memory", type=int, default=65536, help="largest memory_cost in KiB to try")
+    calibrate.add_argument("--max-time-cost", type=int, default=10, help="largest time_cost to try")
+    calibrate.add_argument("--save", action="store_true", help="write the recommendation to config.json")
+    calibrate.set_defaults(handler=calibrate_hashing)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from sqlalchemy import text
+from models import Base
+from crud_ops import rebuild_grade_stats
+
+
+def _create_missing_indexes(connection):
+    # create_all() skips indexes of tables that already exist, so databases
+    # created by older versions never get them without this step
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    connection.execute(text("ANALYZE"))
+
+
+def _backfill_grade_stats(connection):
+    # The summary tables are new; fill them from grades already recorded
+    rebuild_grade_stats(connection)
+
+
+# Ordered list of schema migrations; the position in the list is the schema
+# version stored in PRAGMA user_version after the step has run
+MIGRATIONS = [
+    _create_missing_indexes,
+    _backfill_grade_stats,
+]
+
+
+def get_schema_version(connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def upgrade(engine):
+    """Create missing tables and apply pending migrations to an existing database"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        version = get_schema_version(connection)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(connection)
+            connection.execute(text(f"PRAGMA user_version = {number}"))
@@ -15,7 +15,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, CheckConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -27,7 +27,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    role = Column(String, nullable=False)  # "student" or "teacher"
+    role = Column(String, nullable=False, index=True)  # "student" or "teacher"
 
     grades = relationship("Grade", back_populates="student")
 
@@ -54,4 +54,32 @@ class Grade(Base):
     subject = relationship("Subject", back_populates="grades")
     
     # Add constraint to ensure grade values are between 1 and 5
-    __table_args__ = (CheckConstraint('value >= 1 AND value <= 5', name='check_grade_value'),)
\ No newline at end of file
+    __table_args__ = (
+        CheckConstraint('value >= 1 AND value <= 5', name='check_grade_value'),
+        # Per-student lookups, per-student-per-subject lookups and averages
+        Index('ix_grades_student_subject_date', 'student_id', 'subject_id', 'date'),
+        # Per-subject lookups and the subject-filtered teacher feed
+        Index('ix_grades_subject_date', 'subject_id', 'date'),
+        # Keyset pagination of the teacher feed on (date, id)
+        Index('ix_grades_date_id', 'date', 'id'),
+    )
+
+
+class StudentSubjectStats(Base):
+    # Running sum and count of grades per (student, subject), kept in step with
+    # grades by crud_ops so averages are a primary key lookup
+    __tablename__ = "student_subject_stats"
+
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id"), primary_key=True)
+    grade_sum = Column(Float, nullable=False, default=0)
+    grade_count = Column(Integer, nullable=False, default=0)
+
+
+class StudentStats(Base):
+    # Running sum and count of all grades per student
+    __tablename__ = "student_stats"
+
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    grade_sum = Column(Float, nullable=False, default=0)
+    grade_count = Column(Integer, nullable=False, default=0)
\ No newline at end of file
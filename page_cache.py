@@ -0,0 +1,140 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+from collections import defaultdict
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from cache import LRUCache
+from config import get_config
+from tenants import current_tenant
+import events
+
+
+class CachedPage:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _configured_size() -> int:
+    # "page_cache_size" in config.json bounds each of the two page caches
+    config = get_config()
+    return max(1, int(config.get("page_cache_size", 2048))) if config else 2048
+
+
+def _configured_ttl() -> float:
+    # Invalidation only reaches this process. With several uvicorn workers a
+    # write in one leaves the others' pages stale, for at most "page_cache_ttl"
+    # seconds.
+    config = get_config()
+    return max(1.0, float(config.get("page_cache_ttl", 30))) if config else 30.0
+
+
+# A student page depends on that student's grades, their user record and the
+# subject names. A teacher page lists every grade, student and subject, and
+# varies by its filter / cursor query string. Keys start with the school.
+_student_pages = LRUCache(maxsize=_configured_size(), ttl=_configured_ttl())
+_teacher_pages = LRUCache(maxsize=_configured_size(), ttl=_configured_ttl())
+# Bumped on every invalidation, so a page rendered while the data changed
+# underneath it is not cached. Teacher keys include their school's
+# generation, so bumping it retires all of that school's teacher pages.
+_student_generations = defaultdict(int)
+_teacher_generations = defaultdict(int)
+
+
+def page_key(user, query: str = ""):
+    tenant = current_tenant()
+    if user.role == "student":
+        return ("student", tenant, user.id)
+    return ("teacher", tenant, _teacher_generations[tenant], user.id, query)
+
+
+def generation(key) -> int:
+    if key[0] == "student":
+        return _student_generations[key[1:]]
+    return _teacher_generations[key[1]]
+
+
+def get_page(key):
+    pages = _student_pages if key[0] == "student" else _teacher_pages
+    return pages.get(key)
+
+
+def store_page(key, rendered_at: int, html: str) -> CachedPage:
+    """Cache a rendered page unless it was invalidated while rendering"""
+    page = CachedPage(html.encode("utf-8"))
+    if generation(key) == rendered_at:
+        pages = _student_pages if key[0] == "student" else _teacher_pages
+        pages.set(key, page)
+    return page
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def page_response(request: Request, page: CachedPage) -> Response:
+    # no-cache makes the browser revalidate every time, which is a 304 with
+    # an empty body while the page is unchanged
+    headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, page.etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=page.body, headers=headers)
+
+
+def _invalidate_teacher_pages():
+    _teacher_generations[current_tenant()] += 1
+
+
+def _invalidate_students(student_ids):
+    tenant = current_tenant()
+    for student_id in student_ids:
+        _student_generations[(tenant, student_id)] += 1
+        _student_pages.pop(("student", tenant, student_id))
+
+
+def _on_grades_changed(student_ids, subject_ids):
+    _invalidate_students(student_ids)
+    _invalidate_teacher_pages()
+
+
+def _on_user_changed(user_id):
+    _invalidate_students([user_id])
+    _invalidate_teacher_pages()
+
+
+def clear():
+    """Drop every cached page, e.g. after a config reload"""
+    for tenant in list(_teacher_generations):
+        _teacher_generations[tenant] += 1
+    for key in list(_student_generations):
+        _student_generations[key] += 1
+    _student_pages.clear()
+    _teacher_pages.clear()
+
+
+events.subscribe(events.GRADES_CHANGED, _on_grades_changed)
+events.subscribe(events.USER_CHANGED, _on_user_changed)
+events.subscribe(events.USERS_ADDED, lambda count: _invalidate_teacher_pages())
+events.subscribe(events.SUBJECTS_CHANGED, lambda subject_id: clear())
@@ -0,0 +1,82 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from passlib.context import CryptContext
+from config import get_config
+
+# Argon2 cost parameters; "password_hashing" in config.json overrides any of
+# them ("python manage.py calibrate-hashing" recommends values for this host).
+# Hashes made with other parameters are rehashed on the next successful login.
+DEFAULT_HASH_PARAMS = {
+    "time_cost": 10,
+    "memory_cost": 1024,  # KiB
+    "parallelism": 2,
+}
+
+_lock = threading.Lock()
+_context = None
+_context_params = None
+
+
+def get_hash_params() -> dict:
+    config = get_config()
+    overrides = config.get("password_hashing", {}) if config else {}
+    return {key: int(overrides.get(key, default)) for key, default in DEFAULT_HASH_PARAMS.items()}
+
+
+def make_context(params: dict) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__rounds=params["time_cost"],
+        argon2__memory_cost=params["memory_cost"],
+        argon2__parallelism=params["parallelism"],
+    )
+
+
+def get_context() -> CryptContext:
+    # Rebuilt only when the configured parameters change
+    global _context, _context_params
+    params = get_hash_params()
+    with _lock:
+        if params != _context_params:
+            _context, _context_params = make_context(params), params
+        return _context
+
+
+def _truncate(password: str) -> str:
+    # Applied when verifying too, so passwords longer than 72 bytes match their hash
+    # Truncate password to 72 bytes if needed to be compatible with bcrypt
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        # Truncate to 72 bytes and decode back to string
+        password = password_bytes[:72].decode('utf-8', errors='ignore')
+    return password
+
+
+def get_password_hash(password):
+    return get_context().hash(_truncate(password))
+
+
+def verify_password(plain_password, hashed_password):
+    return get_context().verify(_truncate(plain_password), hashed_password)
+
+
+def verify_and_update_password(plain_password, hashed_password):
+    # Returns (valid, new_hash); new_hash is None unless the stored hash uses
+    # outdated parameters and should be replaced
+    return get_context().verify_and_update(_truncate(plain_password), hashed_password)
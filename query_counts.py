@@ -0,0 +1,122 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import tempfile
+from sqlalchemy import event
+from starlette.requests import Request
+from database import Database
+from migrations import upgrade
+import crud_ops
+
+# Students and grades per student in the two seeded rounds; the second is
+# large enough to fill a whole teacher page
+ROUNDS = ((2, 2), (20, 20))
+
+# ORM grade getters whose callers read grade.student and grade.subject
+GRADE_GETTERS = {
+    "get_all_grades": lambda db, student_id: crud_ops.get_all_grades(db),
+    "get_grades_for_subject": lambda db, student_id: crud_ops.get_grades_for_subject(db, 1),
+    "get_grades_for_student_and_subject": lambda db, student_id: crud_ops.get_grades_for_student_and_subject(
+        db, student_id, 1
+    ),
+}
+
+
+def _request() -> Request:
+    return Request({
+        "type": "http", "method": "GET", "scheme": "http", "server": ("localhost", 80),
+        "path": "/", "root_path": "", "query_string": b"", "headers": [],
+    })
+
+
+def _seed(db, students: int, grades_per_student: int):
+    subject_ids = [subject.id for subject in crud_ops.get_subjects(db)]
+    existing = len(crud_ops.get_students(db))
+    for number in range(existing, students):
+        crud_ops.create_user(db, f"student{number}", None, "student", hashed_password="-")
+    crud_ops.insert_grades(db, [
+        {"value": 1 + n % 5, "student_id": student.id, "subject_id": subject_ids[n % len(subject_ids)]}
+        for student in crud_ops.get_students(db)
+        for n in range(grades_per_student)
+    ])
+
+
+class _StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+async def _count_page_statements(database: Database, render, user) -> int:
+    with _StatementCounter(database.reader_engine.sync_engine) as counter:
+        async with database.ReadSessionLocal() as db:
+            await render(_request(), db, user)
+    return counter.count
+
+
+def _count_getter_statements(database: Database, getter, student_id: int) -> int:
+    db = database.SessionLocal()
+    try:
+        with _StatementCounter(database.engine) as counter:
+            for grade in getter(db, student_id):
+                grade.student.username, grade.subject.name
+        return counter.count
+    finally:
+        db.close()
+
+
+async def _count_rounds(database: Database) -> dict:
+    from main import render_teacher_dashboard, render_student_dashboard
+
+    counts = {name: [] for name in ("teacher page", "student page", *GRADE_GETTERS)}
+    db = database.SessionLocal()
+    try:
+        crud_ops.create_default_subjects(db)
+        teacher = crud_ops.create_user(db, "teacher", None, "teacher", hashed_password="-")
+        for students, grades_per_student in ROUNDS:
+            _seed(db, students, grades_per_student)
+            student = crud_ops.get_user_by_username(db, "student0")
+            counts["teacher page"].append(await _count_page_statements(database, render_teacher_dashboard, teacher))
+            counts["student page"].append(await _count_page_statements(database, render_student_dashboard, student))
+            for name, getter in GRADE_GETTERS.items():
+                counts[name].append(_count_getter_statements(database, getter, student.id))
+    finally:
+        db.close()
+        await database.async_engine.dispose()
+        await database.reader_engine.dispose()
+        database.engine.dispose()
+    return counts
+
+
+def check_query_counts() -> dict:
+    """Render the teacher and student pages and walk the ORM grade getters on a
+    scratch database at two row counts; return the statement count per round"""
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, "users.db"))
+        upgrade(database.engine)
+        return asyncio.run(_count_rounds(database))
@@ -0,0 +1,106 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Grade
+import crud_ops
+
+# crud_ops queries that must be served by an index; every SELECT they issue
+# is checked with EXPLAIN QUERY PLAN. Listing queries such as get_subjects
+# read the whole table by design and are not included.
+CHECKED_QUERIES = {
+    "get_user_by_username": lambda db: crud_ops.get_user_by_username(db, "admin"),
+    "get_user": lambda db: crud_ops.get_user(db, 1),
+    "get_subject_by_name": lambda db: crud_ops.get_subject_by_name(db, "Math"),
+    "get_subject": lambda db: crud_ops.get_subject(db, 1),
+    "get_grades_for_student": lambda db: crud_ops.get_grades_for_student(db, 1),
+    "get_grades_for_subject": lambda db: crud_ops.get_grades_for_subject(db, 1),
+    "get_grades_for_student_and_subject": lambda db: crud_ops.get_grades_for_student_and_subject(db, 1, 1),
+    "get_all_grades": lambda db: crud_ops.get_all_grades(db),
+    "get_grades_page": lambda db: crud_ops.get_grades_page(db),
+    "get_grades_page(cursor)": lambda db: crud_ops.get_grades_page(
+        db, cursor=crud_ops.encode_grade_cursor(Grade(id=1, date=datetime(2026, 1, 1)))
+    ),
+    "get_grades_page(student)": lambda db: crud_ops.get_grades_page(db, student_id=1),
+    "get_grades_page(subject)": lambda db: crud_ops.get_grades_page(db, subject_id=1),
+    "get_grades_page(dates)": lambda db: crud_ops.get_grades_page(
+        db, date_from=datetime(2026, 1, 1), date_to=datetime(2026, 2, 1)
+    ),
+    "get_average_grade_for_student": lambda db: crud_ops.get_average_grade_for_student(db, 1),
+    "get_average_grade_for_student_by_subject": lambda db: crud_ops.get_average_grade_for_student_by_subject(db, 1, 1),
+    "get_subject_summary_for_student": lambda db: crud_ops.get_subject_summary_for_student(db, 1),
+    "get_subject_grade_columns": lambda db: crud_ops.get_subject_grade_columns(db, 1),
+}
+
+# "SCAN grades" is a full table scan. "SCAN grades USING INDEX ..." walks a
+# whole index: fine when it delivers the ORDER BY, but when the plan still
+# needs a temp b-tree to sort, the index is only being used as a narrower table
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+# Tables that grow with the school. subjects holds a handful of rows, and
+# SQLite may rightly prefer scanning it as the outer loop of a join once
+# ANALYZE has seen the real row counts, so it is not checked.
+GROWING_TABLES = {"grades", "users", "student_subject_stats", "student_stats"}
+INDEX_SCAN = re.compile(r"USING (?:COVERING )?INDEX")
+TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+@contextmanager
+def _capture_selects(db: Session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(db: Session, statement: str, parameters) -> list:
+    connection = db.connection()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        # Rows are (id, parent, notused, detail)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def check_query_plans(db: Session) -> list:
+    """Return (query name, plan detail, statement) for every full table scan"""
+    problems = []
+    for name, run_query in CHECKED_QUERIES.items():
+        with _capture_selects(db) as statements:
+            run_query(db)
+        for statement, parameters in statements:
+            plan = explain(db, statement, parameters)
+            for detail in plan:
+                scan = SCAN.match(detail)
+                if scan is None or scan.group(1) not in GROWING_TABLES:
+                    continue
+                if not INDEX_SCAN.search(detail) or TEMP_SORT in plan:
+                    problems.append((name, detail, statement))
+    return problems
@@ -17,98 +17,115 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_read_db
 from models import User
 from schemas import LoginRequest
-from crud_ops import get_user_by_username, verify_password, create_user, get_password_hash
+from crud_async import get_user_by_username, create_user, update_user_password
+from hashing import hash_password_async, verify_and_update_password_async, verify_dummy_password_async
+from throttle import check_login_allowed, login_aborted, login_succeeded
+from config import get_config
+from sessions import SESSION_COOKIE, SESSION_MAX_AGE, create_session_token, read_session_token, get_cached_user
 from typing import Optional
 from fastapi import Form
-import json
-import os
 import bleach
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
-def get_current_user(request: Request, db: Session = Depends(get_db)):
-    user_id = request.cookies.get("user_id")
-    user_role = request.cookies.get("user_role")
-    
-    if not user_id or not user_role:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_read_db)):
+    session = read_session_token(request.cookies.get(SESSION_COOKIE))
+    if not session:
         return None
     
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if not user:
+    # Served from the in-process user cache; the database is only hit on a miss
+    user = await get_cached_user(db, session["uid"])
+    if not user or user.role != session["role"]:
         return None
     
     return user
 
 
+def session_redirect(user: User):
+    # Signed session cookie carrying user id, role and admin flag
+    config = get_config()
+    is_admin = bool(config) and user.username == config.admin_username
+    response = RedirectResponse(url="/", status_code=302)
+    response.set_cookie(
+        key=SESSION_COOKIE,
+        value=create_session_token(user.id, user.role, is_admin),
+        max_age=SESSION_MAX_AGE,
+        httponly=True,
+        samesite="lax",
+    )
+    return response
+
+
+async def authenticate(db: AsyncSession, username: str, password: str):
+    """Return the user for valid credentials; hashing runs in the hashing pool"""
+    # Check if this is admin login by checking config.json
+    config = get_config()
+    if config and config.admin_password is not None:
+        # Check if login matches admin credentials from config
+        if username == config.admin_username and password == config.admin_password:
+            # Find or create admin user in database
+            user = await get_user_by_username(db, username)
+            # Return the connection to the pool while the hash runs
+            await db.commit()
+            if not user:
+                # Create admin user if doesn't exist
+                user = await create_user(username, password, "teacher")
+            else:
+                # Only write when the config password changed or the stored
+                # hash uses outdated parameters, so repeated admin logins
+                # don't take the SQLite write lock
+                valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+                if not valid:
+                    new_hash = await hash_password_async(password)
+                if new_hash:
+                    await update_user_password(user.id, new_hash)
+            return user
+
+    # Database check for non-admin users or if config.json doesn't exist
+    user = await get_user_by_username(db, username)
+    await db.commit()
+    if not user:
+        # Unknown usernames cost the same Argon2 verify as known ones
+        await verify_dummy_password_async(password)
+        valid, new_hash = False, None
+    else:
+        valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials"
+        )
+    if new_hash:
+        # Stored hash predates the configured cost parameters; replace it now
+        # that the plain password is known to be correct
+        await update_user_password(user.id, new_hash)
+    return user
+
+
 @router.post("/login")
-async def login(request: Request, db: Session = Depends(get_db)):
+async def login(request: Request, db: AsyncSession = Depends(get_read_db)):
     form_data = await request.form()
     username = bleach.clean(form_data.get("username", ""))
     password = form_data.get("password", "")
+    # Over-limit attempts are turned away before the database or the hasher
+    check_login_allowed(request, username)
     
     try:
-        user = None  # Initialize user variable
-        
-        # Check if this is admin login by checking config.json
-        if os.path.exists("config.json"):
-            with open("config.json", "r", encoding="utf-8") as f:
-                config = json.load(f)
-                admin_username = config.get("admin_username", "admin")
-                admin_password = config.get("admin_password", "meow")
-            
-            # Check if login matches admin credentials from config
-            if username == admin_username and password == admin_password:
-                # Find or create admin user in database
-                user = get_user_by_username(db, username)
-                if not user:
-                    # Create admin user if doesn't exist
-                    user = create_user(db, username, password, "teacher")
-                else:
-                    # Update admin password if changed
-                    user.hashed_password = get_password_hash(password)
-                    db.commit()
-            else:
-                # Fallback to database check for non-admin users
-                user = get_user_by_username(db, username)
-                if not user or not verify_password(password, user.hashed_password):
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid credentials"
-                    )
-        else:
-            # Fallback to database check if config.json doesn't exist
-            user = get_user_by_username(db, username)
-            if not user or not verify_password(password, user.hashed_password):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid credentials"
-                )
-        
-        # Check if user was found/created
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials"
-            )
+        user = await authenticate(db, username, password)
         
-        # Create response with cookies and redirect to dashboard
-        response = RedirectResponse(url="/", status_code=302)
-        response.set_cookie(key="user_id", value=str(user.id), httponly=True)
-        response.set_cookie(key="user_role", value=user.role, httponly=True)
+        # Create response with session cookie and redirect to dashboard
+        response = session_redirect(user)
+        login_succeeded(request, username)
         return response
     except Exception as e:
+        # Wrong credentials keep the reserved attempt; any other error returns it
+        if not (isinstance(e, HTTPException) and e.status_code == status.HTTP_401_UNAUTHORIZED):
+            login_aborted(request, username)
         # Return error to be handled by middleware
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -117,61 +134,23 @@ async def login(request: Request, db: Session = Depends(get_db)):
 
 
 @router.post("/login-cookie")
-async def login_cookie(request: Request, db: Session = Depends(get_db)):
+async def login_cookie(request: Request, db: AsyncSession = Depends(get_read_db)):
     form_data = await request.form()
     username = bleach.clean(form_data.get("username", ""))
     password = form_data.get("password", "")
+    # Over-limit attempts are turned away before the database or the hasher
+    check_login_allowed(request, username)
     
     try:
-        user = None  # Initialize user variable
-        
-        # Check if this is admin login by checking config.json
-        if os.path.exists("config.json"):
-            with open("config.json", "r", encoding="utf-8") as f:
-                config = json.load(f)
-                admin_username = config.get("admin_username", "admin")
-                admin_password = config.get("admin_password", "meow")
-            
-            # Check if login matches admin credentials from config
-            if username == admin_username and password == admin_password:
-                # Find or create admin user in database
-                user = get_user_by_username(db, username)
-                if not user:
-                    # Create admin user if doesn't exist
-                    user = create_user(db, username, password, "teacher")
-                else:
-                    # Update admin password if changed
-                    user.hashed_password = get_password_hash(password)
-                    db.commit()
-            else:
-                # Fallback to database check for non-admin users
-                user = get_user_by_username(db, username)
-                if not user or not verify_password(password, user.hashed_password):
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid credentials"
-                    )
-        else:
-            # Fallback to database check if config.json doesn't exist
-            user = get_user_by_username(db, username)
-            if not user or not verify_password(password, user.hashed_password):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid credentials"
-                )
-        
-        # Check if user was found/created
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials"
-            )
+        user = await authenticate(db, username, password)
         
-        response = RedirectResponse(url="/", status_code=302)
-        response.set_cookie(key="user_id", value=str(user.id), httponly=True)
-        response.set_cookie(key="user_role", value=user.role, httponly=True)
+        response = session_redirect(user)
+        login_succeeded(request, username)
         return response
     except Exception as e:
+        # Wrong credentials keep the reserved attempt; any other error returns it
+        if not (isinstance(e, HTTPException) and e.status_code == status.HTTP_401_UNAUTHORIZED):
+            login_aborted(request, username)
         # Return error to be handled by middleware
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -182,6 +161,5 @@ async def login_cookie(request: Request, db: Session = Depends(get_db)):
 @router.get("/logout")
 def logout():
     response = RedirectResponse(url="/login", status_code=302)
-    response.delete_cookie("user_id")
-    response.delete_cookie("user_role")
+    response.delete_cookie(SESSION_COOKIE)
     return response
\ No newline at end of file
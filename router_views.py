@@ -16,39 +16,39 @@
 
 
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Database, get_read_db, get_write_db, current_database_async
 from router_auth import get_current_user
-from crud_ops import get_grades_for_student, get_subjects, get_all_grades, get_average_grade_for_student, create_grade, get_grades_for_student_and_subject, get_average_grade_for_student_by_subject, get_user_by_username, create_user, get_password_hash
+from sessions import SESSION_COOKIE
+from crud_ops import GRADES_PAGE_SIZE
+from crud_async import create_grade, create_grades_bulk, get_user_by_username, create_user, get_grades_page, get_users_except, get_subject_summary_for_student, get_subjects, get_usernames
 from models import User, Grade
-from fastapi import Form
-import json
+from schemas import GradeBulkCreate
+from pydantic import ValidationError
+from fastapi import Form, File, UploadFile
+from datetime import datetime, timedelta
+import asyncio
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
-from models import User, Grade, Base
+from migrations import upgrade
+from hashing import hash_password_async, get_hash_pool_stats
+from config import get_admin_username, get_config, save_config, reload_config
+from importer import start_import, get_job
+from exporter import grades_csv, grades_ndjson
+from analytics import get_subject_statistics, AT_RISK_THRESHOLD
+import page_cache
+import group_commit
+from instrumentation import instrument_templates, metrics_allowed, render_metrics
 import bleach
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+templates = instrument_templates(Jinja2Templates(directory="templates"))
 
 
 def require_login(request: Request):
-    user_id = request.cookies.get("user_id")
-    user_role = request.cookies.get("user_role")
-    
-    if not user_id or not user_role:
+    if not request.cookies.get(SESSION_COOKIE):
         return RedirectResponse(url="/login", status_code=302)
     
     return None
@@ -56,15 +56,41 @@ def require_login(request: Request):
 
 def is_admin_user(current_user: User) -> bool:
     """Check if current user is the admin user defined in config.json"""
-    if not os.path.exists("config.json"):
-        return False
-    
-    with open("config.json", "r", encoding="utf-8") as f:
-        config = json.load(f)
-        admin_username = config.get("admin_username", "admin")
-    
     # Admin is the user whose username matches the admin_username in config
-    return current_user.username == admin_username
+    return current_user.username == get_admin_username()
+
+
+def parse_grade_filters(params) -> dict:
+    """Turn grade feed query parameters into keyword arguments for get_grades_page"""
+    def optional_int(name):
+        value = params.get(name, "")
+        if value == "":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Некорректное значение параметра {name}")
+
+    def optional_date(name):
+        value = params.get(name, "")
+        if value == "":
+            return None
+        try:
+            return datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Некорректная дата в параметре {name}")
+
+    limit = optional_int("limit")
+    date_to = optional_date("date_to")
+    return {
+        "limit": limit if limit is not None else GRADES_PAGE_SIZE,
+        "cursor": params.get("cursor") or None,
+        "student_id": optional_int("student_id"),
+        "subject_id": optional_int("subject_id"),
+        "date_from": optional_date("date_from"),
+        # date_to is inclusive for the user, so compare against the next midnight
+        "date_to": date_to + timedelta(days=1) if date_to else None,
+    }
 
 
 # Removed the home route since it's now handled in main.py
@@ -130,8 +156,33 @@ def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 
+def create_setup_admin(database: Database, admin_username: str, hashed_password: str):
+    """Create the schema and the admin user; runs in a worker thread"""
+    upgrade(database.engine)
+    
+    # Create session
+    db_session = database.SessionLocal()
+    
+    try:
+        # Check if admin user already exists
+        admin_user = db_session.query(User).filter(User.username == admin_username).first()
+        if not admin_user:
+            # Create admin user
+            db_user = User(username=admin_username, hashed_password=hashed_password, role="teacher")
+            db_session.add(db_user)
+            db_session.commit()
+            db_session.refresh(db_user)
+            print("Admin user created successfully.")
+        else:
+            print("Admin user already exists.")
+    except Exception as e:
+        print(f"Error setting up database: {e}")
+    finally:
+        db_session.close()
+
+
 @router.post("/setup")
-async def setup(request: Request, db: Session = Depends(get_db)):
+async def setup(request: Request):
     form_data = await request.form()
     language = bleach.clean(form_data.get("language", ""))
     grading_system = bleach.clean(form_data.get("grading_system", ""))
@@ -147,35 +198,18 @@ async def setup(request: Request, db: Session = Depends(get_db)):
             "admin_password": admin_password
         }
         
-        with open("config.json", "w", encoding="utf-8") as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=4)
+        # Merge into an existing config so the session signing key and settings
+        # such as tenants or password_hashing survive a repeated setup
+        existing = get_config()
+        save_config(dict(existing.raw if existing else {}, **config_data))
         
         # Create database if it doesn't exist
-        if not os.path.exists("users.db"):
-            engine = create_engine('sqlite:///users.db')
-            Base.metadata.create_all(engine)
-            
-            # Create session
-            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-            db_session = SessionLocal()
-            
-            try:
-                # Check if admin user already exists
-                admin_user = db_session.query(User).filter(User.username == admin_username).first()
-                if not admin_user:
-                    # Create admin user
-                    hashed_password = get_password_hash(admin_password)
-                    db_user = User(username=admin_username, hashed_password=hashed_password, role="teacher")
-                    db_session.add(db_user)
-                    db_session.commit()
-                    db_session.refresh(db_user)
-                    print("Admin user created successfully.")
-                else:
-                    print("Admin user already exists.")
-            except Exception as e:
-                print(f"Error setting up database: {e}")
-            finally:
-                db_session.close()
+        database = await current_database_async()
+        if not os.path.exists(database.path):
+            # Hash in the hashing pool, then do the sync database work in a
+            # thread so the event loop keeps serving other requests
+            hashed_password = await hash_password_async(admin_password)
+            await asyncio.to_thread(create_setup_admin, database, admin_username, hashed_password)
         
         # Redirect to login page after setup
         return RedirectResponse(url="/login", status_code=302)
@@ -193,13 +227,13 @@ async def add_grade(
     student_id: int = Form(...),
     subject_id: int = Form(...),
     value: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     redirect_response = require_login(request)
     if redirect_response:
         return redirect_response
     
-    current_user = get_current_user(request, db)
+    current_user = await get_current_user(request, db)
     if not current_user or current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Только учителя могут добавлять оценки")
     
@@ -208,7 +242,7 @@ async def add_grade(
         raise HTTPException(status_code=400, detail="Оценка должна быть от 1 до 5")
     
     try:
-        create_grade(db, value, student_id, subject_id)
+        await create_grade(value, student_id, subject_id)
         return RedirectResponse(url="/", status_code=302)
     except Exception as e:
         error = str(e)
@@ -217,19 +251,287 @@ async def add_grade(
             "error": error
         })
 
+@router.post("/grades/bulk")
+async def add_grades_bulk(request: Request, db: AsyncSession = Depends(get_write_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Только учителя могут добавлять оценки")
+
+    # JSON clients send a full matrix of (student, subject, value, date) rows
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = GradeBulkCreate.model_validate(await request.json())
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            created = await create_grades_bulk(db, [item.model_dump() for item in payload.grades])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return JSONResponse({"created": created})
+
+    # Grid form from the dashboard: one subject and date for the class, one value per student
+    form_data = await request.form()
+    try:
+        subject_id = int(form_data.get("subject_id", ""))
+        date = datetime.strptime(form_data["date"], "%Y-%m-%d") if form_data.get("date") else None
+        rows = [
+            {"student_id": int(key[len("value_"):]), "subject_id": subject_id, "value": float(value), "date": date}
+            for key, value in form_data.items()
+            if key.startswith("value_") and value != ""
+        ]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректные данные формы")
+
+    try:
+        if not rows:
+            raise ValueError("Не выставлено ни одной оценки")
+        await create_grades_bulk(db, rows)
+        return RedirectResponse(url="/", status_code=302)
+    except ValueError as e:
+        return templates.TemplateResponse("alert.html", {
+            "request": request,
+            "error": str(e)
+        })
+
+
+@router.get("/export/grades.{export_format}")
+async def export_grades(export_format: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Только учителя могут выгружать оценки")
+
+    filters = parse_grade_filters(request.query_params)
+    del filters["limit"], filters["cursor"]
+    if export_format == "csv":
+        return StreamingResponse(grades_csv(filters), media_type="text/csv", headers={
+            "Content-Disposition": "attachment; filename=grades.csv"
+        })
+    if export_format == "ndjson":
+        return StreamingResponse(grades_ndjson(filters), media_type="application/x-ndjson")
+    raise HTTPException(status_code=404, detail="Page not found")
+
+
+@router.get("/api/students/{student_id}/subjects")
+async def api_student_subjects(student_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    # Students may only see their own breakdown; teachers see any student's
+    current_user = await get_current_user(request, db)
+    if not current_user or (current_user.role != "teacher" and current_user.id != student_id):
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    summary = await get_subject_summary_for_student(db, student_id)
+    return JSONResponse([
+        {
+            "subject_id": row.subject_id,
+            "subject": row.subject,
+            "average": row.average,
+            "count": row.count,
+            "latest_value": row.latest_value,
+            "latest_date": row.latest_date.isoformat() if row.latest_date else None,
+        }
+        for row in summary
+    ])
+
+
+@router.get("/analytics")
+async def analytics_page(request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Только учителя могут просматривать аналитику")
+
+    try:
+        threshold = float(request.query_params.get("threshold") or AT_RISK_THRESHOLD)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный порог")
+
+    report = []
+    for subject in await get_subjects(db):
+        subject_statistics = await get_subject_statistics(db, subject.id)
+        report.append((subject, subject_statistics, subject_statistics.at_risk(threshold)))
+    at_risk_ids = {student_id for _, _, at_risk in report for student_id, _ in at_risk}
+    usernames = await get_usernames(db, at_risk_ids)
+
+    return templates.TemplateResponse("analytics.html", {
+        "request": request,
+        "current_user": current_user,
+        "report": report,
+        "usernames": usernames,
+        "threshold": threshold
+    })
+
+
+@router.get("/api/analytics/{subject_id}")
+async def api_analytics(subject_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Только учителя могут просматривать аналитику")
+
+    try:
+        threshold = float(request.query_params.get("threshold") or AT_RISK_THRESHOLD)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный порог")
+
+    subject_statistics = await get_subject_statistics(db, subject_id)
+    at_risk = subject_statistics.at_risk(threshold)
+    usernames = await get_usernames(db, [student_id for student_id, _ in at_risk])
+    return JSONResponse({
+        "subject_id": subject_id,
+        "count": subject_statistics.count,
+        "mean": subject_statistics.mean,
+        "median": subject_statistics.median,
+        "std": subject_statistics.std,
+        "histogram": subject_statistics.histogram,
+        "at_risk": [
+            {"student_id": student_id, "student": usernames.get(student_id), "mean": mean}
+            for student_id, mean in at_risk
+        ],
+    })
+
+
+@router.get("/api/grades")
+async def api_grades(request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Только учителя могут просматривать оценки")
+
+    filters = parse_grade_filters(request.query_params)
+    try:
+        grades, next_cursor = await get_grades_page(db, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return JSONResponse({
+        "items": [
+            {
+                "id": grade.id,
+                "student_id": grade.student_id,
+                "student": grade.student,
+                "subject_id": grade.subject_id,
+                "subject": grade.subject,
+                "value": grade.value,
+                "date": grade.date.isoformat() if grade.date else None,
+            }
+            for grade in grades
+        ],
+        "next_cursor": next_cursor,
+    })
+
+@router.get("/api/hash-pool")
+async def api_hash_pool(request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or not is_admin_user(current_user):
+        raise HTTPException(status_code=403, detail="Доступно только администратору")
+
+    return JSONResponse(get_hash_pool_stats())
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    # Scraped by Prometheus, so no session; limited to "metrics_allow" addresses
+    if not metrics_allowed(request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="Доступ к метрикам запрещён")
+
+    hash_pool = get_hash_pool_stats()
+    writers = group_commit.get_group_commit_stats().values()
+    return PlainTextResponse(render_metrics({
+        "openschool_password_hash_queued": ("Hashes waiting for a hashing thread.", hash_pool["queued"]),
+        "openschool_password_hash_running": ("Hashes running now.", hash_pool["running"]),
+        "openschool_group_commit_queued": ("Writes waiting for the group commit writer.", sum(w["queued"] for w in writers)),
+    }, {
+        "openschool_group_commits_total": ("Group commits since start.", sum(w["commits"] for w in writers)),
+    }), media_type="text/plain; version=0.0.4")
+
+@router.post("/config/reload")
+async def config_reload(request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or not is_admin_user(current_user):
+        raise HTTPException(status_code=403, detail="Доступно только администратору")
+
+    reload_config()
+    # Cached pages may depend on config values such as the admin username
+    page_cache.clear()
+    return RedirectResponse(url="/", status_code=302)
+
+@router.post("/import/{kind}")
+async def import_upload(kind: str, request: Request, file: UploadFile = File(...), db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or not is_admin_user(current_user):
+        raise HTTPException(status_code=403, detail="Доступно только администратору")
+    if kind not in ("users", "grades"):
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    job = await start_import(kind, file)
+    return RedirectResponse(url=f"/import/{job.id}", status_code=302)
+
+
+@router.get("/import/{job_id}")
+async def import_status(job_id: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    redirect_response = require_login(request)
+    if redirect_response:
+        return redirect_response
+
+    current_user = await get_current_user(request, db)
+    if not current_user or not is_admin_user(current_user):
+        raise HTTPException(status_code=403, detail="Доступно только администратору")
+
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Импорт не найден")
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse(job.to_dict())
+    return templates.TemplateResponse("import.html", {
+        "request": request,
+        "current_user": current_user,
+        "job": job
+    })
+
 # User management routes
 @router.get("/users")
-def get_users(request: Request, db: Session = Depends(get_db)):
+async def get_users(request: Request, db: AsyncSession = Depends(get_read_db)):
     redirect_response = require_login(request)
     if redirect_response:
         return redirect_response
     
-    current_user = get_current_user(request, db)
+    current_user = await get_current_user(request, db)
     if not current_user or not is_admin_user(current_user):
         return RedirectResponse(url="/login", status_code=302)
     
     # Only show students and other teachers (not the current user in the list for deletion/modification)
-    users = db.query(User).filter(User.id != current_user.id).all()
+    users = await get_users_except(db, current_user.id)
     
     # Add Russian role translation
     for user in users:
@@ -249,12 +551,12 @@ def get_users(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/users/add")
-async def add_user(request: Request, db: Session = Depends(get_db)):
+async def add_user(request: Request, db: AsyncSession = Depends(get_read_db)):
     redirect_response = require_login(request)
     if redirect_response:
         return redirect_response
     
-    current_user = get_current_user(request, db)
+    current_user = await get_current_user(request, db)
     if not current_user or not is_admin_user(current_user):
         return RedirectResponse(url="/login", status_code=302)
     
@@ -268,7 +570,7 @@ async def add_user(request: Request, db: Session = Depends(get_db)):
         role = "student"
     
     # Check if user already exists
-    existing_user = get_user_by_username(db, username)
+    existing_user = await get_user_by_username(db, username)
     if existing_user:
         return templates.TemplateResponse("alert.html", {
             "request": request,
@@ -276,8 +578,8 @@ async def add_user(request: Request, db: Session = Depends(get_db)):
         })
     
     try:
-        # Create new user
-        create_user(db, username, password, role)
+        # Create new user, hashing the password off the event loop
+        await create_user(username, password, role)
         return RedirectResponse(url="/", status_code=302)
     except Exception as e:
         error = str(e)
@@ -15,8 +15,9 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
 
 
 class UserBase(BaseModel):
@@ -60,6 +61,14 @@ class GradeCreate(GradeBase):
     pass
 
 
+class GradeBulkItem(GradeBase):
+    date: Optional[datetime] = None
+
+
+class GradeBulkCreate(BaseModel):
+    grades: List[GradeBulkItem] = Field(..., min_length=1, max_length=5000)
+
+
 class Grade(GradeBase):
     id: int
 
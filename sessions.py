@@ -0,0 +1,122 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import LRUCache
+from config import get_config, save_config
+from models import User
+import events
+from tenants import current_tenant
+
+SESSION_COOKIE = "session"
+SESSION_MAX_AGE = 30 * 24 * 3600
+
+# Bounded cache of user records so authenticated requests skip the users lookup
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 300
+
+ROLE_NAMES_RU = {"teacher": "учитель", "student": "ученик"}
+
+_process_secret = secrets.token_hex(32)
+
+
+def _secret_key() -> bytes:
+    # Persist a key in config.json so sessions survive restarts; before setup
+    # has written a config, fall back to a per-process key
+    config = get_config()
+    if not config:
+        return _process_secret.encode("utf-8")
+    secret = config.get("secret_key")
+    if not secret:
+        secret = secrets.token_hex(32)
+        save_config(dict(config.raw, secret_key=secret))
+    return secret.encode("utf-8")
+
+
+def _sign(payload: bytes) -> str:
+    digest = hmac.new(_secret_key(), payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+
+def create_session_token(user_id: int, role: str, is_admin: bool) -> str:
+    payload = json.dumps(
+        {"uid": user_id, "tid": current_tenant(), "role": role, "adm": is_admin, "iat": int(time.time())},
+        separators=(",", ":"),
+    ).encode("utf-8")
+    body = base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+    return f"{body}.{_sign(payload)}"
+
+
+def read_session_token(token: Optional[str]) -> Optional[dict]:
+    """Return the token payload if the signature is valid and not expired"""
+    if not token or "." not in token:
+        return None
+    body, signature = token.rsplit(".", 1)
+    try:
+        payload = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+    except ValueError:
+        return None
+    if not hmac.compare_digest(_sign(payload), signature):
+        return None
+    session = json.loads(payload)
+    if session.get("iat", 0) + SESSION_MAX_AGE < time.time():
+        return None
+    # User ids are only unique within one school's database
+    if session.get("tid") != current_tenant():
+        return None
+    return session
+
+
+class CachedUser:
+    """Detached, read-only copy of the User columns pages need"""
+
+    __slots__ = ("id", "username", "role", "role_ru")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self.role_ru = ROLE_NAMES_RU.get(user.role, user.role)
+
+
+_user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+async def get_cached_user(db: AsyncSession, user_id: int) -> Optional[CachedUser]:
+    key = (current_tenant(), user_id)
+    cached = _user_cache.get(key)
+    if cached is None:
+        user = await db.get(User, user_id)
+        if not user:
+            return None
+        cached = CachedUser(user)
+        _user_cache.set(key, cached)
+    return cached
+
+
+def invalidate_user(user_id: int):
+    _user_cache.pop((current_tenant(), user_id))
+
+
+events.subscribe(events.USER_CHANGED, invalidate_user)
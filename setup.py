@@ -19,25 +19,16 @@ import os
 import json
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from models import Base, User
-from passlib.context import CryptContext
-
-# Configure argon2 for password hashing
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", argon2__rounds=10, argon2__memory_cost=1024, argon2__parallelism=2)
-
-def get_password_hash(password):
-    # Truncate password to 72 bytes if needed to be compatible with bcrypt
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        # Truncate to 72 bytes and decode back to string
-        password = password_bytes[:72].decode('utf-8', errors='ignore')
-    return pwd_context.hash(password)
+from models import User
+from migrations import upgrade
+from database import configure_sqlite
+from passwords import get_password_hash
 
 def setup_database():
     """Create database and initialize with admin user"""
     # Create SQLite database
-    engine = create_engine('sqlite:///users.db')
-    Base.metadata.create_all(engine)
+    engine = configure_sqlite(create_engine('sqlite:///users.db'))
+    upgrade(engine)
     
     # Create session
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
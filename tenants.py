@@ -0,0 +1,142 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from config import get_config
+
+# Multi-school mode is enabled by a "tenants" object in config.json:
+#
+#   "tenants": {
+#       "mode": "host",                      # or "path"
+#       "schools": {
+#           "school12": {"hosts": ["school12.example.org"]},
+#           "lyceum": {}
+#       }
+#   }
+#
+# Each school gets its own SQLite file under schools/. In host mode a request
+# is routed by its Host header, or by a first host label equal to a school id.
+# In path mode /s/<school>/... selects the school and the prefix is stripped;
+# the choice is kept in a cookie, so the absolute links in the pages keep
+# working. Without "tenants" the app uses users.db as before.
+PATH_PREFIX = "/s/"
+TENANT_COOKIE = "school"
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+# The school of the request being served; None in single-school mode. Set by
+# TenantMiddleware and inherited by tasks the request starts.
+_current_tenant: ContextVar[Optional[str]] = ContextVar("tenant", default=None)
+
+_routing = (None, None)
+
+
+def current_tenant() -> Optional[str]:
+    return _current_tenant.get()
+
+
+def set_current_tenant(tenant: Optional[str]):
+    """Select a school outside a request, e.g. in manage.py; returns a reset token"""
+    return _current_tenant.set(tenant)
+
+
+def get_tenant_settings() -> Optional[dict]:
+    config = get_config()
+    return config.get("tenants") if config else None
+
+
+def get_tenant_ids() -> list:
+    settings = get_tenant_settings() or {}
+    return [tenant for tenant in settings.get("schools", {}) if TENANT_ID_PATTERN.match(tenant)]
+
+
+def _host_map(settings: dict) -> dict:
+    # Rebuilt only when config.json changes
+    global _routing
+    config = get_config()
+    if _routing[0] is not config:
+        hosts = {}
+        for tenant, school in settings.get("schools", {}).items():
+            if TENANT_ID_PATTERN.match(tenant):
+                for host in school.get("hosts", []):
+                    hosts[host.lower()] = tenant
+        _routing = (config, hosts)
+    return _routing[1]
+
+
+def resolve_tenant(scope) -> tuple:
+    """Return (tenant, path) for an ASGI scope; tenant is None when unknown"""
+    settings = get_tenant_settings()
+    path = scope["path"]
+    request = Request(scope)
+    schools = settings.get("schools", {})
+    if settings.get("mode") == "path":
+        if path.startswith(PATH_PREFIX):
+            tenant, _, rest = path[len(PATH_PREFIX):].partition("/")
+            if tenant in schools and TENANT_ID_PATTERN.match(tenant):
+                return tenant, "/" + rest
+            return None, path
+        tenant = request.cookies.get(TENANT_COOKIE)
+        return (tenant if tenant in schools and TENANT_ID_PATTERN.match(tenant) else None), path
+
+    host = request.headers.get("host", "").split(":", 1)[0].lower()
+    tenant = _host_map(settings).get(host)
+    if tenant is None:
+        label = host.split(".", 1)[0]
+        if label in schools and TENANT_ID_PATTERN.match(label):
+            tenant = label
+    return tenant, path
+
+
+class TenantMiddleware:
+    """Route each request to its school's database before any handler runs"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not get_tenant_settings() or scope["path"].startswith("/static/"):
+            await self.app(scope, receive, send)
+            return
+
+        tenant, path = resolve_tenant(scope)
+        if tenant is None:
+            # Imported here: errors renders templates and is not needed at startup
+            from errors import not_found_response
+            await not_found_response(Request(scope))(scope, receive, send)
+            return
+
+        if path != scope["path"]:
+            prefix = PATH_PREFIX + tenant
+            scope = dict(scope, path=path, root_path=scope.get("root_path", "") + prefix)
+            send = self._remember_tenant(send, tenant)
+
+        token = _current_tenant.set(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_tenant.reset(token)
+
+    @staticmethod
+    def _remember_tenant(send, tenant: str):
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                cookie = f"{TENANT_COOKIE}={tenant}; Path=/; HttpOnly; SameSite=Lax".encode("latin-1")
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"set-cookie", cookie)])
+            await send(message)
+        return send_with_cookie
@@ -0,0 +1,121 @@
+# OpenSchool - Электронный дневник
+# Copyright (C) 2026 (linuxdev)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from cache import LRUCache
+from config import get_config
+from tenants import current_tenant
+
+# Defaults; "login_rate_limit" in config.json overrides any of these keys.
+# Every attempt reserves a token before it is checked and only failed logins
+# keep it, so a whole school signing in from behind one NAT or proxy is never
+# throttled, while a burst of concurrent guesses is.
+LOGIN_RATE_LIMIT = {
+    "ip_failures": 100,       # failed or in-flight logins per window from one address
+    "username_failures": 5,   # failed or in-flight logins per window against one username
+    "window": 60,             # seconds to refill an empty bucket
+    "max_tracked": 10000,     # buckets kept per key kind; least recent dropped
+}
+
+
+def _limits() -> dict:
+    config = get_config()
+    overrides = config.get("login_rate_limit", {}) if config else {}
+    return dict(LOGIN_RATE_LIMIT, **overrides)
+
+
+class TokenBuckets:
+    """Token bucket per key that refills continuously over the window, which
+    behaves like a sliding window without storing every attempt. Buckets live
+    in an LRU so memory stays bounded however many keys an attacker uses."""
+
+    def __init__(self, capacity: int, window: float, maxsize: int):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self._buckets = LRUCache(maxsize)
+
+    def _tokens(self, key, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def take(self, key) -> float:
+        """Consume one token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+    def refund(self, key):
+        now = time.monotonic()
+        self._buckets.set(key, (min(self.capacity, self._tokens(key, now) + 1), now))
+
+    def reset(self, key):
+        self._buckets.pop(key)
+
+
+_ip_buckets: Optional[TokenBuckets] = None
+_username_buckets: Optional[TokenBuckets] = None
+
+
+def _get_buckets():
+    global _ip_buckets, _username_buckets
+    if _ip_buckets is None:
+        limits = _limits()
+        _ip_buckets = TokenBuckets(limits["ip_failures"], limits["window"], limits["max_tracked"])
+        _username_buckets = TokenBuckets(limits["username_failures"], limits["window"], limits["max_tracked"])
+    return _ip_buckets, _username_buckets
+
+
+def _client(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def check_login_allowed(request: Request, username: str):
+    """Reserve an attempt from the address and the username buckets, rejecting
+    the login before any database access or hashing when either is empty.
+    The caller settles the reservation with login_succeeded or login_aborted;
+    a failed login keeps it."""
+    ip_buckets, username_buckets = _get_buckets()
+    client = _client(request)
+    retry_after = ip_buckets.take(client)
+    if not retry_after:
+        retry_after = username_buckets.take((current_tenant(), username.lower()))
+        if retry_after:
+            ip_buckets.refund(client)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа, попробуйте позже",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+
+def login_aborted(request: Request, username: str):
+    # The attempt failed for a reason other than the password; give it back
+    ip_buckets, username_buckets = _get_buckets()
+    ip_buckets.refund(_client(request))
+    username_buckets.refund((current_tenant(), username.lower()))
+
+
+def login_succeeded(request: Request, username: str):
+    # A correct password returns the address's token and clears the username's failures
+    ip_buckets, username_buckets = _get_buckets()
+    ip_buckets.refund(_client(request))
+    username_buckets.reset((current_tenant(), username.lower()))